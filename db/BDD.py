@@ -0,0 +1,294 @@
+from utils.PrettyStream import *
+
+# Edges are 2*index + complement bit, node 0 is the terminal
+TRUE = 0
+FALSE = 1
+
+class BDDOverflow(Exception):
+    """
+    Raised when a BDD grows past the node limit of its manager
+    """
+    pass
+
+class BDD:
+    """
+    A reduced ordered binary decision diagram manager with complement edges.
+
+    Nodes live in flat lists indexed by node id, and every function is an edge:
+    2*index + complement bit. The then-edge of a node is never complemented, which
+    together with the unique table makes every function canonical, so two functions
+    built in the same manager are equal exactly when their edges are equal.
+    """
+    def __init__(self, order, node_limit=1 << 21, cache_limit=1 << 20):
+        """
+        Args:
+            order (list): Variable names from the top level to the bottom level
+            node_limit (int): Raise BDDOverflow past this many nodes
+            cache_limit (int): Clear the computed table past this many entries
+        """
+        self.order = list(order)
+        self.level = {name: i for i, name in enumerate(self.order)}
+        self.var = [len(self.order)]
+        self.high = [TRUE]
+        self.low = [TRUE]
+        self.unique = {}
+        self.computed = {}
+        self.node_limit = node_limit
+        self.cache_limit = cache_limit
+
+    def __len__(self):
+        return len(self.var)
+
+    def mk(self, v, hi, lo):
+        """
+        Return the edge of the node (v, hi, lo), creating it if needed
+        """
+        if hi == lo:
+            return hi
+        if hi & 1:
+            return self.mk(v, hi ^ 1, lo ^ 1) ^ 1
+        key = (v, hi, lo)
+        index = self.unique.get(key)
+        if index is None:
+            index = len(self.var)
+            if index >= self.node_limit:
+                raise BDDOverflow(f"BDD exceeded {self.node_limit} nodes")
+            self.var.append(v)
+            self.high.append(hi)
+            self.low.append(lo)
+            self.unique[key] = index
+        return index << 1
+
+    def variable(self, name):
+        return self.mk(self.level[name], TRUE, FALSE)
+
+    def cofactors(self, f, v):
+        index = f >> 1
+        if self.var[index] != v:
+            return f, f
+        c = f & 1
+        return self.high[index] ^ c, self.low[index] ^ c
+
+    def ite(self, f, g, h):
+        """
+        If-then-else: the core operation every other operator is built on.
+        Pending calls are kept on an explicit stack, so BDDs with more levels than
+        the recursion limit are built too.
+        """
+        result, call = self.ite_lookup(f, g, h)
+        if call is None:
+            return result
+        # Each frame is [normalized call, complement of its result, top variable,
+        # else-cofactors, then-cofactor result], then-cofactors are expanded first
+        stack = []
+        while True:
+            if call is not None:
+                key, complement = call
+                v = min(self.var[key[0] >> 1], self.var[key[1] >> 1], self.var[key[2] >> 1])
+                then_call, else_call = [], []
+                for x in key:
+                    index = x >> 1
+                    if self.var[index] == v:
+                        c = x & 1
+                        then_call.append(self.high[index] ^ c)
+                        else_call.append(self.low[index] ^ c)
+                    else:
+                        then_call.append(x)
+                        else_call.append(x)
+                stack.append([key, complement, v, else_call, None])
+                result, call = self.ite_lookup(*then_call)
+                if call is not None:
+                    continue
+            # A call returned result, hand it to the frame waiting for it
+            while True:
+                frame = stack[-1]
+                if frame[4] is None:
+                    frame[4] = result
+                    result, call = self.ite_lookup(*frame[3])
+                    break
+                stack.pop()
+                key, complement, v, _, high = frame
+                result = self.mk(v, high, result)
+                if len(self.computed) >= self.cache_limit:
+                    self.computed.clear()
+                self.computed[key] = result
+                result ^= complement
+                if not stack:
+                    return result
+
+    def ite_lookup(self, f, g, h):
+        """
+        Resolve ite(f, g, h) without expanding it: terminal cases and the computed table
+
+        Returns:
+            tuple: (edge, None) if resolved, otherwise (None, (normalized call, complement))
+        """
+        if f == TRUE:
+            return g, None
+        if f == FALSE:
+            return h, None
+        if g == f:
+            g = TRUE
+        elif g == f ^ 1:
+            g = FALSE
+        if h == f:
+            h = FALSE
+        elif h == f ^ 1:
+            h = TRUE
+        if g == h:
+            return g, None
+        if g == TRUE and h == FALSE:
+            return f, None
+        if g == FALSE and h == TRUE:
+            return f ^ 1, None
+        # Normalize so f and g are regular, complementing the result if needed
+        if f & 1:
+            f, g, h = f ^ 1, h, g
+        complement = g & 1
+        if complement:
+            g, h = g ^ 1, h ^ 1
+        key = (f, g, h)
+        result = self.computed.get(key)
+        if result is not None:
+            return result ^ complement, None
+        return None, (key, complement)
+
+    def AND(self, f, g):
+        return self.ite(f, g, FALSE)
+
+    def NAND(self, f, g):
+        return self.ite(f, g, FALSE) ^ 1
+
+    def OR(self, f, g):
+        return self.ite(f, TRUE, g)
+
+    def NOR(self, f, g):
+        return self.ite(f, TRUE, g) ^ 1
+
+    def XOR(self, f, g):
+        return self.ite(f, g ^ 1, g)
+
+    def XNOR(self, f, g):
+        return self.ite(f, g, g ^ 1)
+
+    # Direct constructions for common truth tables, keyed by (arity, truth table)
+    TABLE_OPS = {
+        (1, 0b10): lambda self, a: a,
+        (1, 0b01): lambda self, a: a ^ 1,
+        (2, 0b1000): AND,
+        (2, 0b0111): NAND,
+        (2, 0b1110): OR,
+        (2, 0b0001): NOR,
+        (2, 0b0110): XOR,
+        (2, 0b1001): XNOR,
+    }
+
+    def from_table(self, table, fanins):
+        """
+        Build an arbitrary truth table over fanin edges by Shannon expansion.
+        Input i selects bit i of the truth table index.
+        """
+        n = len(fanins)
+        if n == 0:
+            return TRUE if table & 1 else FALSE
+        op = BDD.TABLE_OPS.get((n, table))
+        if op is not None:
+            return op(self, *fanins)
+        half = 1 << (n - 1)
+        low = table & ((1 << half) - 1)
+        high = table >> half
+        return self.ite(fanins[-1], self.from_table(high, fanins[:-1]), self.from_table(low, fanins[:-1]))
+
+    def build(self, sim):
+        """
+        Build the BDDs of all outputs of a levelized Simulator
+
+        Returns:
+            dict: Mapping from output name to edge
+        """
+        edges = {}
+        for name, slot in sim.input_slots.items():
+            edges[slot] = self.variable(name)
+        for slot, arity, table, fanins in sim.program:
+            edges[slot] = self.from_table(table, [edges[f] for f in fanins])
+        return {name: edges[slot] for name, slot in sim.outputs.items()}
+
+    def satisfy(self, f):
+        """
+        Return one assignment of the variables that makes f true, or None if f is FALSE.
+        Variables not on the path are set to 0.
+        """
+        if f == FALSE:
+            return None
+        env = {name: 0 for name in self.order}
+        while f >> 1 != 0:
+            index = f >> 1
+            c = f & 1
+            hi = self.high[index] ^ c
+            lo = self.low[index] ^ c
+            name = self.order[self.var[index]]
+            if lo != FALSE:
+                f = lo
+            else:
+                env[name] = 1
+                f = hi
+        return env
+
+def dfs_order(sims):
+    """
+    Variable ordering heuristic: inputs are ordered by a depth-first traversal from
+    the outputs that visits the deepest fanin first, so inputs feeding the same
+    logic end up close together in the order.
+
+    Args:
+        sims (list): Levelized Simulators sharing the same input names
+    Returns:
+        list: Input names from the top level to the bottom level
+    """
+    order = []
+    seen_inputs = set()
+    for sim in sims:
+        names = {slot: name for name, slot in sim.input_slots.items()}
+        fanins = {}
+        depth = {slot: 0 for slot in names}
+        for slot, arity, table, f in sim.program:
+            fanins[slot] = f
+            depth[slot] = 1 + max((depth[i] for i in f), default=0)
+        visited = set()
+        for root in sim.outputs.values():
+            stack = [root]
+            while stack:
+                slot = stack.pop()
+                if slot in visited:
+                    continue
+                visited.add(slot)
+                if slot in names:
+                    if names[slot] not in seen_inputs:
+                        seen_inputs.add(names[slot])
+                        order.append(names[slot])
+                    continue
+                # Push the shallowest fanin first so the deepest is visited first
+                stack.extend(sorted(fanins.get(slot, ()), key=lambda i: depth[i]))
+        for name in sim.inputs:
+            if name not in seen_inputs:
+                seen_inputs.add(name)
+                order.append(name)
+    return order
+
+def find_bdd_mismatch(sim, other, pairs, node_limit=1 << 21):
+    """
+    Compare outputs of two simulators by building their BDDs in one manager.
+
+    Args:
+        pairs (list): List of (output of sim, output of other) to compare
+    Returns:
+        tuple: (output pair, env) of the first mismatch, or None if all outputs match
+    """
+    bdd = BDD(dfs_order([sim, other]), node_limit=node_limit)
+    mine = bdd.build(sim)
+    theirs = bdd.build(other)
+    vprint(f"Built BDDs with {len(bdd)} nodes", v=DEBUG)
+    for a, b in pairs:
+        if mine[a] != theirs[b]:
+            return (a, b), bdd.satisfy(bdd.XOR(mine[a], theirs[b]))
+    return None
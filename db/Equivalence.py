@@ -0,0 +1,171 @@
+import random
+from collections import deque
+from utils.PrettyStream import *
+from db.Node import Node
+from db.NandGraph import NandGraph
+from db.SAT import Solver
+from db.Simulator import Simulator, find_mismatch, exhaustive_limit
+from db.Patterns import PatternSource
+from db.BDD import find_bdd_mismatch, BDDOverflow
+
+# Number of random patterns simulated before any proof is attempted
+RANDOM_PATTERNS = 4096
+RANDOM_SEED = 0
+
+# Counterexamples found during this session, most recent first.
+# They are replayed before the random patterns since a bad pass tends to fail the same way again.
+counterexample_cache = deque(maxlen=256)
+
+def remember_counterexample(env):
+    env = dict(env)
+    if env in counterexample_cache:
+        counterexample_cache.remove(env)
+    counterexample_cache.appendleft(env)
+
+def trees_eq(tree, other, db=None, other_db=None, workers=1):
+    """
+    Compare two trees for logical equivalence. Either may also be a leaf: a constant or
+    a signal, which is resolved through the variables of its database.
+    With workers other than 1 the exhaustive check is split across a process pool
+    (None uses every core), which also allows exhaustive checks of wider cones.
+    """
+    vprint(f"Comparing\n{describe(tree)}\nwith\n{describe(other)}for logical equivalence", v=DEBUG)
+    mine = Simulator({"out": tree}, db)
+    theirs = Simulator({"out": other}, other_db)
+    input_set = set(mine.inputs)
+    other_input_set = set(theirs.inputs)
+    if(input_set != other_input_set):
+        # Logic optimization may drop redundant leaves, so compare over the union
+        vprint(f'Leaf mismatch: {input_set} vs {other_input_set}',v=DEBUG)
+    names = list(dict.fromkeys(mine.inputs + theirs.inputs))
+    if(len(names) <= exhaustive_limit(workers)):
+        vprint(f"Testing {2**len(names)} patterns", v=DEBUG)
+        if workers == 1:
+            mismatch = find_mismatch(mine, theirs, [("out", "out")], PatternSource(names))
+        else:
+            from db.Parallel import run_checks
+            result = run_checks([("out", mine, theirs, [("out", "out")], names)], workers)
+            mismatch = None if result is None else result[1]
+    else:
+        vprint(f"Comparing BDDs of {len(names)} inputs", v=DEBUG)
+        try:
+            mismatch = find_bdd_mismatch(mine, theirs, [("out", "out")])
+        except BDDOverflow as e:
+            err_msg(f'Skipping logical equivalence check: {e}')
+            return False
+    if mismatch is not None:
+        remember_counterexample(mismatch[1])
+        vprint(f"Test Failed on pattern {mismatch[1]}", v=FAILED)
+        return False
+    vprint("The trees are logically equivalent", v=DEBUG)
+    return True
+
+def describe(tree):
+    return tree.pretty(PrettyStream()) if isinstance(tree, Node) else f"{tree}\n"
+
+def simulation_counterexample(db, other, n_patterns=RANDOM_PATTERNS):
+    """
+    Fast pre-filter for equivalence checks: simulate both databases on the cached
+    counterexamples followed by random patterns, all packed into one bit-parallel pass,
+    and compare the output signatures.
+
+    Returns:
+        tuple: (output, env) for the first output whose signatures differ, or None
+    """
+    outputs = [o for o in db.outputs if o in other.outputs]
+    sim = Simulator({o: db.vars[o] for o in outputs if db.vars.get(o) is not None}, db)
+    other_sim = Simulator({o: other.vars[o] for o in outputs if other.vars.get(o) is not None}, other)
+    names = list(dict.fromkeys(sim.inputs + other_sim.inputs))
+    cached = list(counterexample_cache)
+    width = len(cached) + n_patterns
+    rng = random.Random(RANDOM_SEED)
+    words = {}
+    for name in names:
+        word = 0
+        for j, env in enumerate(cached):
+            if env.get(name, 0):
+                word |= 1 << j
+        words[name] = word | (rng.getrandbits(n_patterns) << len(cached)) if n_patterns else word
+    mine = sim.run(words, width)
+    theirs = other_sim.run(words, width)
+    for output in sorted(mine):
+        if output not in theirs:
+            continue
+        diff = mine[output] ^ theirs[output]
+        if diff:
+            j = (diff & -diff).bit_length() - 1
+            env = {name: (words[name] >> j) & 1 for name in names}
+            source = "cached counterexample" if j < len(cached) else "random pattern"
+            vprint(f"Output {output} signature differs on {source} {env}", v=DEBUG)
+            remember_counterexample(env)
+            return output, env
+    vprint(f"Signatures of {len(mine)} outputs match on {width} patterns", v=DEBUG)
+    return None
+
+def build_miter(db, other):
+    """
+    Build a miter between two databases: both are added to one NandGraph with
+    inputs shared by name, and each pair of same-named outputs is XORed together.
+    Structural hashing already merges the logic both databases have in common.
+
+    Returns:
+        tuple: (graph, dict mapping each output to the literal of its XOR)
+    """
+    graph = NandGraph(f"miter_{db.name}_{other.name}")
+    mine = graph.add_db(db)
+    theirs = graph.add_db(other)
+    diffs = {}
+    for output in db.outputs:
+        if output in mine and output in theirs:
+            diffs[output] = graph.XOR(mine[output], theirs[output])
+    return graph, diffs
+
+def tseitin(graph, roots, solver):
+    """
+    Tseitin-encode the cone of the root literals into CNF.
+    Gate i of the graph becomes variable i of the solver, so graph literals are solver literals.
+    """
+    while solver.n_vars < len(graph):
+        solver.new_var()
+    solver.add_clause([1])
+    stack = [lit >> 1 for lit in roots]
+    encoded = set()
+    while stack:
+        index = stack.pop()
+        if index in encoded or graph.types[index] != NandGraph.GATE:
+            continue
+        encoded.add(index)
+        out = 2 * index
+        a = graph.fanin0[index]
+        b = graph.fanin1[index]
+        solver.add_clause([out ^ 1, a])
+        solver.add_clause([out ^ 1, b])
+        solver.add_clause([out, a ^ 1, b ^ 1])
+        stack.append(a >> 1)
+        stack.append(b >> 1)
+    return encoded
+
+def sat_counterexample(db, other):
+    """
+    Prove equivalence of all common outputs of two databases on a SAT miter.
+
+    Returns:
+        tuple: (output, env) where env is an input assignment on which the output
+        differs, or None if all outputs are equivalent
+    """
+    graph, diffs = build_miter(db, other)
+    solver = Solver()
+    encoded = tseitin(graph, diffs.values(), solver)
+    vprint(f"Encoded miter with {len(encoded)} gates for {len(diffs)} outputs", v=VERBOSE)
+    for output in sorted(diffs):
+        lit = diffs[output]
+        if lit == 0:
+            vprint(f"Output {output} is structurally equivalent", v=DEBUG)
+            continue
+        if solver.solve([lit]):
+            env = {name: solver.model_value(l >> 1) for name, l in graph.inputs.items()}
+            vprint(f"Output {output} differs on {env}", v=DEBUG)
+            remember_counterexample(env)
+            return output, env
+        vprint(f"Output {output} proven equivalent after {solver.conflicts} conflicts", v=DEBUG)
+    return None
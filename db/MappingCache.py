@@ -0,0 +1,192 @@
+"""
+Cache of technology mapping covers.
+A cover is kept as a template of nested tuples that only refers to the subject tree
+through child index paths and leaf names, so it can be rebuilt on any subtree with the
+same structure, in a later run or in another process:
+
+    (cell name, children)
+
+where each child is ("leaf", name or constant) or ("cover", path, template), path being
+the child indices leading from the covered node to the node the sub-template covers.
+Templates nest as deep as the logic they cover, so they are packed into a flat table
+before pickling.
+"""
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from numbers import Number
+from utils.PrettyStream import *
+from db.Node import Node
+from db.Traversal import fold
+
+# Number of covers kept in memory by default
+CACHE_CAPACITY = 1 << 16
+
+def structural_hash(node, hashes=None):
+    """
+    Hash of the structure of a tree: its cells, the order of their children and the leaf names.
+    Structurally identical trees have the same hash in every process.
+
+    Args:
+        hashes (dict): Hashes of subtrees by node id, reused and extended
+    Returns:
+        str: Hex digest of the tree
+    """
+    hashes = {} if hashes is None else hashes
+
+    def leaf_hash(leaf):
+        if isinstance(leaf, Node):
+            return hashes[id(leaf)]
+        if isinstance(leaf, Number):
+            return f"c:{int(leaf)}"
+        return f"s:{leaf}"
+
+    def node_hash(n, children):
+        digest = hashlib.sha1(f"{n.cell_name}({','.join(children)})".encode()).hexdigest()
+        hashes[id(n)] = digest
+        return digest
+
+    return fold(node, node_hash, leaf_hash, stop=lambda n: id(n) in hashes)
+
+def pack_templates(templates):
+    """
+    Encode templates as a flat table of (cell name, children), where the sub-template of
+    a cover child is the index of an earlier row. Shared sub-templates are stored once
+    and the table pickles without recursion.
+
+    Returns:
+        tuple: (table, row of each template)
+    """
+    index = {}
+    table = []
+    for template in templates:
+        stack = [(template, False)]
+        while stack:
+            t, expanded = stack.pop()
+            if id(t) in index:
+                continue
+            cell_name, children = t
+            if not expanded:
+                stack.append((t, True))
+                stack.extend((c[2], False) for c in children if c[0] == "cover")
+                continue
+            packed = tuple(("cover", c[1], index[id(c[2])]) if c[0] == "cover" else c for c in children)
+            index[id(t)] = len(table)
+            table.append((cell_name, packed))
+    return table, [index[id(t)] for t in templates]
+
+def unpack_templates(table):
+    """
+    Returns:
+        list: The template of each row of a table made by pack_templates
+    """
+    templates = []
+    for cell_name, children in table:
+        templates.append((cell_name, tuple(("cover", c[1], templates[c[2]]) if c[0] == "cover" else c for c in children)))
+    return templates
+
+def pack_entries(entries):
+    """
+    Encode cache entries for pickling
+
+    Returns:
+        tuple: (template table, list of (key, row, cost))
+    """
+    keys = list(entries)
+    table, rows = pack_templates([entries[key][0] for key in keys])
+    return table, [(key, row, entries[key][1]) for key, row in zip(keys, rows)]
+
+def unpack_entries(packed):
+    """
+    Returns:
+        OrderedDict: Cache entries encoded by pack_entries, in the same order
+    """
+    table, rows = packed
+    templates = unpack_templates(table)
+    return OrderedDict((key, (templates[row], cost)) for key, row, cost in rows)
+
+class MappingCache:
+    """
+    LRU cache of covers keyed by (structural hash of the subject tree, library fingerprint).
+    With a path the cache is loaded from and saved to a pickle file, so covers carry over
+    between runs.
+    """
+    def __init__(self, capacity=CACHE_CAPACITY, path=None):
+        """
+        Args:
+            capacity (int): Number of covers kept, least recently used ones are evicted first
+            path (str): File the cache persists to, in memory only if None
+        """
+        self.capacity = capacity
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["entries"] = pack_entries(self.entries)
+        return state
+
+    def __setstate__(self, state):
+        state["entries"] = unpack_entries(state["entries"])
+        self.__dict__.update(state)
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: (template, cost) of the cover, or None if it is not cached
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        self.dirty = True
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.dirty = True
+
+    def load(self):
+        """
+        Read the cache file, an unreadable file is ignored
+        """
+        try:
+            with open(self.path, "rb") as f:
+                entries = unpack_entries(pickle.load(f))
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError, IndexError) as e:
+            err_msg(f"Ignoring unreadable mapping cache {self.path}: {e}")
+            return
+        for key, entry in entries.items():
+            self.put(key, entry)
+        self.dirty = False
+        vprint(f"Loaded {len(self.entries)} covers from {self.path}", v=VERBOSE)
+
+    def save(self):
+        """
+        Write the cache file if the cache is persistent and changed since it was last loaded or saved
+        """
+        if self.path is None or not self.dirty:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(pack_entries(self.entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self.dirty = False
+        vprint(f"Saved {len(self.entries)} covers to {self.path}", v=VERBOSE)
@@ -0,0 +1,92 @@
+"""
+Log of technology mapping steps, replayed by the mapping animator.
+Steps only hold names and strings, never subject nodes, so a log does not keep
+the mapped database alive. Each step is a dict:
+
+    {"node": output signal, "cell": cell name, "pattern": pattern, "matched": bool,
+     "children": child names, "tree": top of the cover, "cost": cover cost}
+
+where tree and cost are only present for matched steps. The top of a cover is the root
+level of its template, (cell name, children) with each cover child reduced to
+("cover", path, cell name), since whole templates nest as deep as the logic.
+"""
+import json
+from collections import deque
+from numbers import Number
+from utils.PrettyStream import *
+from db.Node import Node
+
+# Number of steps kept in memory by default
+STEP_CAPACITY = 1 << 14
+
+def leaf_name(leaf):
+    if isinstance(leaf, Node):
+        return leaf.output_signal
+    if isinstance(leaf, Number):
+        return int(leaf)
+    return leaf
+
+class MappingLog:
+    """
+    Bounded record of mapping steps. In memory only the latest steps are kept,
+    with a path every step is streamed to a JSON lines file instead.
+    """
+    def __init__(self, capacity=STEP_CAPACITY, path=None):
+        """
+        Args:
+            capacity (int): Number of steps kept in memory, oldest ones are dropped first
+            path (str): File the steps are appended to, in memory only if None
+        """
+        self.path = path
+        self.steps = deque(maxlen=capacity)
+        self.recorded = 0
+        self.file = None if path is None else open(path, "w")
+
+    def __len__(self):
+        return self.recorded
+
+    def record(self, node, cell_name, pattern, template=None, cost=None):
+        """
+        Record an attempt to match pattern of cell_name at node, template is the
+        cover of the node if the pattern matched
+        """
+        step = {
+            "node": node.output_signal,
+            "cell": cell_name,
+            "pattern": repr(pattern),
+            "matched": template is not None,
+            "children": [leaf_name(c) for c in node.children],
+        }
+        if template is not None:
+            cell, children = template
+            step["tree"] = (cell, [c if c[0] == "leaf" else ("cover", c[1], c[2][0]) for c in children])
+            step["cost"] = cost
+        self.recorded += 1
+        if self.file is None:
+            self.steps.append(step)
+        else:
+            self.file.write(json.dumps(step) + "\n")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            vprint(f"Saved {self.recorded} mapping steps to {self.path}", v=VERBOSE)
+
+    def replay(self):
+        """
+        Returns:
+            list: The recorded steps, read back from the file if the log is on disk
+        """
+        if self.path is None:
+            return list(self.steps)
+        if self.file is not None:
+            self.file.flush()
+        return read_steps(self.path)
+
+def read_steps(path):
+    """
+    Read the steps of a mapping log file
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
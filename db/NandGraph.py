@@ -0,0 +1,298 @@
+from array import array
+from numbers import Number
+from utils.PrettyStream import *
+from db.Node import Node
+from db.Traversal import resolve
+from db.LogicNodes import NAND, INV
+
+class NandGraph:
+    """
+    A structurally hashed NAND/INV graph stored in flat integer arrays.
+    Each gate is an index into the arrays and holds a two-input AND of its fanins,
+    a NAND gate is the complemented output of an AND, and an inverter is a complement bit on an edge.
+
+    Signals are referred to by literals: 2*index + complement bit.
+    Node 0 is the constant, so literal 0 is constant 0 and literal 1 is constant 1.
+    Gates are hash-consed through an open-addressing table, also stored in a flat array,
+    so identical subexpressions exist exactly once and fanins always have a smaller index
+    than the gate they drive.
+    """
+
+    CONST = 0
+    INPUT = 1
+    GATE = 2
+
+    def __init__(self, name=None):
+        self.name = name
+        self.fanin0 = array('i', [0])
+        self.fanin1 = array('i', [0])
+        self.types = array('b', [NandGraph.CONST])
+        self.n_gates = 0
+        self.table = array('i', bytes(4 * 1024))
+        self.input_names = {}
+        self.inputs = {}
+        self.outputs = {}
+
+    def __len__(self):
+        return len(self.types)
+
+    def add_input(self, name):
+        """
+        Add a primary input and return its literal
+        """
+        if name in self.inputs:
+            return self.inputs[name]
+        index = len(self.types)
+        self.fanin0.append(0)
+        self.fanin1.append(0)
+        self.types.append(NandGraph.INPUT)
+        self.input_names[index] = name
+        self.inputs[name] = 2 * index
+        return 2 * index
+
+    def add_output(self, name, lit):
+        self.outputs[name] = lit
+
+    def AND(self, a, b):
+        """
+        Return the literal of a AND b, reusing an existing gate when possible
+        """
+        if a > b:
+            a, b = b, a
+        if a == 0 or a == b ^ 1:
+            return 0
+        if a == 1 or a == b:
+            return b
+        slot = self._lookup(a, b)
+        index = self.table[slot]
+        if index == 0:
+            index = len(self.types)
+            self.fanin0.append(a)
+            self.fanin1.append(b)
+            self.types.append(NandGraph.GATE)
+            self.table[slot] = index
+            self.n_gates += 1
+            if 2 * self.n_gates > len(self.table):
+                self._rehash()
+        return 2 * index
+
+    def _lookup(self, a, b):
+        """
+        Find the table slot holding gate (a, b), or the empty slot where it belongs
+        """
+        table = self.table
+        mask = len(table) - 1
+        slot = (a * 0x9E3779B1 ^ b * 0x85EBCA77) & mask
+        while True:
+            index = table[slot]
+            if index == 0 or (self.fanin0[index] == a and self.fanin1[index] == b):
+                return slot
+            slot = (slot + 1) & mask
+
+    def _rehash(self):
+        self.table = array('i', bytes(8 * len(self.table)))
+        for index in range(len(self.types)):
+            if self.types[index] == NandGraph.GATE:
+                self.table[self._lookup(self.fanin0[index], self.fanin1[index])] = index
+
+    def NAND(self, a, b):
+        return self.AND(a, b) ^ 1
+
+    def INV(self, a):
+        return a ^ 1
+
+    def OR(self, a, b):
+        return self.AND(a ^ 1, b ^ 1) ^ 1
+
+    def NOR(self, a, b):
+        return self.AND(a ^ 1, b ^ 1)
+
+    def XOR(self, a, b):
+        return self.NAND(self.NAND(a, b ^ 1), self.NAND(a ^ 1, b))
+
+    def XNOR(self, a, b):
+        return self.XOR(a, b) ^ 1
+
+    def MUX(self, s, a1, a0):
+        return self.NAND(self.NAND(s, a1), self.NAND(s ^ 1, a0))
+
+    # Direct constructions for common truth tables, keyed by (arity, truth table)
+    TABLE_OPS = {
+        (1, 0b10): lambda self, a: a,
+        (1, 0b01): INV,
+        (2, 0b1000): AND,
+        (2, 0b0111): NAND,
+        (2, 0b1110): OR,
+        (2, 0b0001): NOR,
+        (2, 0b0110): XOR,
+        (2, 0b1001): XNOR,
+    }
+
+    def from_table(self, table, fanins):
+        """
+        Build an arbitrary truth table over fanin literals by Shannon expansion.
+        Input i selects bit i of the truth table index.
+        """
+        n = len(fanins)
+        if n == 0:
+            return table & 1
+        op = NandGraph.TABLE_OPS.get((n, table))
+        if op is not None:
+            return op(self, *fanins)
+        half = 1 << (n - 1)
+        low = 0
+        high = 0
+        for j in range(half):
+            low |= ((table >> j) & 1) << j
+            high |= ((table >> (j + half)) & 1) << j
+        f0 = self.from_table(low, fanins[:-1])
+        f1 = self.from_table(high, fanins[:-1])
+        return self.MUX(fanins[-1], f1, f0)
+
+    @classmethod
+    def from_db(cls, db):
+        """
+        Build a graph from a TinyDB. Leaf strings naming other variables are
+        resolved to their trees, so logic shared through variables exists once.
+        """
+        graph = cls(db.name)
+        for name, lit in graph.add_db(db).items():
+            graph.add_output(name, lit)
+        vprint(f"Built graph with {graph.gate_count()} gates for {db.name}", v=VERBOSE)
+        return graph
+
+    def add_db(self, db):
+        """
+        Add the logic of a TinyDB to the graph. Inputs are shared by name with
+        logic already in the graph, and identical logic is merged by structural hashing.
+
+        Returns:
+            dict: Mapping from each driven output of db to its literal
+        """
+        for name in db.inputs:
+            self.add_input(name)
+        node_lits = {}
+
+        def leaf_lit(leaf):
+            leaf = resolve(leaf, db)
+            if isinstance(leaf, Node):
+                return node_lits[id(leaf)]
+            if isinstance(leaf, Number):
+                return int(bool(leaf))
+            return self.add_input(leaf)
+
+        for node in db.topological_order():
+            fanins = [leaf_lit(c) for c in node.children]
+            node_lits[id(node)] = self.from_table(type(node).truth_table(), fanins)
+        # Outputs assigned a plain signal or constant are driven too
+        return {name: leaf_lit(db.vars[name]) for name in db.outputs if db.vars.get(name) is not None}
+
+    def fanouts(self):
+        """
+        Count the references to each gate from other gates and outputs
+        """
+        counts = array('l', bytes(8 * len(self.types)))
+        for index in range(len(self.types)):
+            if self.types[index] == NandGraph.GATE:
+                counts[self.fanin0[index] >> 1] += 1
+                counts[self.fanin1[index] >> 1] += 1
+        for lit in self.outputs.values():
+            counts[lit >> 1] += 1
+        return counts
+
+    def to_db(self, name=None):
+        """
+        Convert the graph back into a TinyDB of NAND/INV trees.
+        Gates driving more than one fanout become variables, so nothing is duplicated.
+        """
+        from db.TinyDB import TinyDB
+        db = TinyDB(self.name if name is None else name)
+        for i in self.inputs:
+            db.add_input(i)
+        for o in self.outputs:
+            db.add_output(o)
+        counts = self.fanouts()
+        var_names = {}
+        for out, lit in self.outputs.items():
+            index = lit >> 1
+            if lit & 1 and self.types[index] == NandGraph.GATE and counts[index] > 1:
+                var_names.setdefault(index, out)
+        for index in range(len(self.types)):
+            if self.types[index] == NandGraph.GATE and counts[index] > 1 and index not in var_names:
+                var_names[index] = f"n{index}_var"
+
+        def build(lit, out):
+            """
+            Build the tree of a literal, stopping at shared gates other than the root
+            """
+            root = lit >> 1
+            cone = set()
+            stack = [root] if self.types[root] == NandGraph.GATE else []
+            while stack:
+                index = stack.pop()
+                cone.add(index)
+                for f in (self.fanin0[index], self.fanin1[index]):
+                    j = f >> 1
+                    if self.types[j] == NandGraph.GATE and j not in var_names and j not in cone:
+                        stack.append(j)
+            nands = {}
+
+            def ref(l, signal=None):
+                j = l >> 1
+                kind = self.types[j]
+                if kind == NandGraph.CONST:
+                    return l & 1
+                if kind == NandGraph.INPUT:
+                    name = self.input_names[j]
+                    return INV(name, out=signal) if l & 1 else name
+                base = nands[j] if j in nands else var_names[j]
+                return base if l & 1 else INV(base, out=signal)
+
+            # Fanins always have smaller indices, so ascending order is topological
+            for index in sorted(cone):
+                signal = out if index == root and lit & 1 else None
+                nands[index] = NAND(ref(self.fanin0[index]), ref(self.fanin1[index]), out=signal)
+            return ref(lit, out)
+
+        for index, var in var_names.items():
+            if var not in self.outputs:
+                db.add_var(var, build(2 * index + 1, var))
+        for out, lit in self.outputs.items():
+            tree = build(lit, out)
+            if not isinstance(tree, Node):
+                # Outputs tied to a constant or an input are buffered with a double inversion
+                tree = INV(INV(tree), out=out)
+            db.vars[out] = tree
+            db._register_node(tree)
+        return db
+
+    def simulate(self, words, width):
+        """
+        Bit-parallel simulation of the graph.
+
+        Args:
+            words (dict): Mapping from input name to packed word
+            width (int): Number of patterns packed in each word
+        Returns:
+            dict: Mapping from output name to packed word
+        """
+        mask = (1 << width) - 1
+        values = [0] * len(self.types)
+        for index, name in self.input_names.items():
+            values[index] = words[name] & mask
+        fanin0 = self.fanin0
+        fanin1 = self.fanin1
+        for index in range(len(self.types)):
+            if self.types[index] == NandGraph.GATE:
+                a = fanin0[index]
+                b = fanin1[index]
+                va = values[a >> 1] ^ (mask if a & 1 else 0)
+                vb = values[b >> 1] ^ (mask if b & 1 else 0)
+                values[index] = va & vb
+        return {o: values[l >> 1] ^ (mask if l & 1 else 0) for o, l in self.outputs.items()}
+
+    def gate_count(self):
+        return self.n_gates
+
+    def __repr__(self):
+        return f"NandGraph {self.name}({len(self.inputs)} inputs, {len(self.outputs)} outputs, {self.gate_count()} gates)"
@@ -1,9 +1,10 @@
-from itertools import product
+from itertools import product, count
 from numbers import Number
 from utils.PrettyStream import *
 from enum import Enum
 from copy import copy
 import uuid
+from db.Traversal import post_order, pre_order, fold, topological, resolve, evaluate
 
 class Node():
     """
@@ -23,7 +24,8 @@ class Node():
         POST_PLACE = 2
         POST_ROUTE = 3
     
-    counter = 0
+    # Shared by all threads, next() on an itertools.count is atomic
+    counter = count()
     var_map = {}
 
     cell_name = None
@@ -36,13 +38,46 @@ class Node():
         """
         Get an identifier for the node for debugging.
         """
-        var =  f"{Node.counter}w"
-        Node.counter += 1
-        return var
+        return f"{next(Node.counter)}w"
     
     @classmethod
     def cell_info(cls):
         return f"{cls.cell_name}({','.join(cls.input_pins)})->{cls.output_pin} [{len(cls.patterns)} patterns]"
+
+    @classmethod
+    def truth_table(cls):
+        """
+        Returns the truth table of the cell's output function as an integer.
+        Bit j of the table is the output when input pin i is set to bit i of j.
+        """
+        if "_truth_table" not in cls.__dict__:
+            table = 0
+            arity = len(cls.input_pins)
+            for j in range(1 << arity):
+                if cls.output_func(*[(j >> i) & 1 for i in range(arity)]):
+                    table |= 1 << j
+            cls._truth_table = table
+        return cls._truth_table
+
+    @classmethod
+    def is_symmetric(cls):
+        """
+        Whether the output function is invariant under any permutation of the inputs,
+        so the children of the cell may be matched in any order
+        """
+        if "_symmetric" not in cls.__dict__:
+            table = cls.truth_table()
+            arity = len(cls.input_pins)
+            symmetric = True
+            # Swapping each pair of neighbouring inputs generates all permutations
+            for i in range(arity - 1):
+                for j in range(1 << arity):
+                    a, b = (j >> i) & 1, (j >> (i + 1)) & 1
+                    swapped = j & ~(3 << i) | (b << i) | (a << (i + 1))
+                    if (table >> j) & 1 != (table >> swapped) & 1:
+                        symmetric = False
+            cls._symmetric = symmetric
+        return cls._symmetric
     
     def __init__(self, children, out=None):
         self.state = Node.State.PRE_SYNTH
@@ -52,7 +87,6 @@ class Node():
                 err_msg(f"{c} is a reserved keyword and cannot be used as an input")
                 raise ValueError(c)
         self.output_signal = Node.new_node() if out is None else out
-        self.optimal_match = None
         self.cuts = []
 
         self.node_id = str(uuid.uuid4())[:5]
@@ -78,24 +112,26 @@ class Node():
         return nodes
 
     def in_order_iterator(self):
-        for c in self.children:
-            if isinstance(c, Node):
-                yield from c.in_order_iterator()
-            else:
-                yield c
-        yield self
+        yield from post_order(self)
 
     def __iter__(self):
         return self.in_order_iterator()
 
     def get_all_leaf(self, db=None):
+        """
+        The input signals of the tree, references to variables of db are replaced
+        by the memoized support of the variable, aliases by the signal they resolve to
+        """
         input_set = set()
-        for i in self:
-            if isinstance(i,str):
-                if db is not None and i in db.vars and isinstance(db.vars[i],Node):
-                    input_set |= db.vars[i].get_all_leaf(db)
-                else:
-                    input_set.add(i)
+        for node in topological([self]):
+            for c in node.children:
+                if not isinstance(c, str):
+                    continue
+                leaf = resolve(c, db)
+                if isinstance(leaf, Node):
+                    input_set |= db.support(c)
+                elif isinstance(leaf, str):
+                    input_set.add(leaf)
         return input_set
     
     def get_all_intermediate(self):
@@ -107,86 +143,56 @@ class Node():
         return inter_set
     
     def copy(self, new_wire=True):
-        new_children = [c.copy(new_wire) if isinstance(c, Node) else c for c in self.children]
-        new_node = self.__class__(*new_children)
-        if new_wire:
-            new_node.output_signal = Node.new_node()
-        else:
-            new_node.output_signal = self.output_signal
-        return new_node
+        def copy_node(node, new_children):
+            new_node = node.__class__(*new_children)
+            if new_wire:
+                new_node.output_signal = Node.new_node()
+            else:
+                new_node.output_signal = node.output_signal
+            return new_node
+        return fold(self, copy_node)
     
     def get_all_input_pattern(self,db=None):
-        input_set = self.get_all_leaf(db)
-        input_patterns = product([0, 1], repeat=len(input_set))
-        input_envs = [dict(zip(list(input_set), bits)) for bits in input_patterns]
-        return input_envs
+        """
+        Returns a lazy PatternSource over all patterns of the leaves of the tree
+        """
+        from db.Patterns import PatternSource
+        return PatternSource(sorted(self.get_all_leaf(db)))
 
     def pretty(self, p=None):
         if p is None:
             p = PrettyStream()
-        p << [f'{self.cell_name}|{self.output_signal}']
-        with p:
-            for c in self.children:
-                if isinstance(c, Node):
-                    c.pretty(p)
-                else:
-                    p << c
+        base = p.depth
+        for item, depth in pre_order(self, depth=True):
+            p.set_indent(base + depth)
+            if isinstance(item, Node):
+                p << [f'{item.cell_name}|{item.output_signal}']
+            else:
+                p << item
+        p.set_indent(base)
         return p.cache
     
     def __repr__(self):
-        str_children = []
-        for c in self.children:
-            str_children.append(str(c))
-        joined = ",".join(str_children)
-        return f"{self.cell_name}|{self.output_signal}({joined})"
+        def node_repr(node, str_children):
+            joined = ",".join(str_children)
+            return f"{node.cell_name}|{node.output_signal}({joined})"
+        return fold(self, node_repr, str)
     
     def eval(self, env_dict=None, db=None,**env):
         """
         Evaluate the node given an environment
         """
         env = env if env_dict is None else env_dict
-        child_env = []
-        for child in self.children:
-            if isinstance(child, Node):
-                if child.output_signal in env:
-                    child_env.append(env[child])
-                else:
-                    child_env.append(child.eval(env,db))
-            elif isinstance(child, Number):
-                child_env.append(child)
-            elif child in env:
-                child_env.append(env[child])
-            elif db is not None and child in db.vars and isinstance(db.vars[child],Node):
-                child_env.append(db.vars[child].eval(env,db))
-            else:
-                err_msg(f"Insufficient env: variable {child} undefined")
-                raise ValueError(child)
-        return type(self).output_func(*child_env)
+        return evaluate([self], env, db)[id(self)]
     
-    def logical_eq(self, other, my_db=None, other_db=None):
+    def logical_eq(self, other, my_db=None, other_db=None, workers=1):
         """
         Compares two tree for logical equivalence.
+        With workers other than 1 the exhaustive check is split across a process pool
+        (None uses every core), which also allows exhaustive checks of wider cones.
         """
-        vprint(f"Comparing\n{self.pretty(PrettyStream())}\nwith\n{other.pretty(PrettyStream())}for logical equivalence", v=DEBUG)
-        input_set = self.get_all_leaf(my_db)
-        other_input_set = other.get_all_leaf(other_db)
-        if(input_set != other_input_set):
-            vprint(f'Leaf mismatch: {input_set} vs {other_input_set}',v=FAILED)
-            return False
-        if(len(input_set) > 7):
-            err_msg(f'Skipping logical equivalence check with more than 7 inputs')
-            return False
-        all_patterns = self.get_all_input_pattern(my_db)
-        vprint(f"Testing {len(all_patterns)} patterns", v=DEBUG)
-        for env in all_patterns:
-            se = self.eval(env,my_db)
-            oe = other.eval(env,other_db)
-            vprint(f'Tested Pattern {env}, {int(se)}|{int(oe)}',v=DEBUG)
-            if(self.eval(env,my_db) != other.eval(env,other_db)):
-                vprint(f"Test Failed", v=FAILED)
-                return False
-        vprint("The nodes are logically equivalent", v=DEBUG)
-        return True
+        from db.Equivalence import trees_eq
+        return trees_eq(self, other, my_db, other_db, workers)
     
     def gate_count(self):
         """
@@ -207,16 +213,15 @@ class Node():
         Returns a tuple (gate, connections, id)
         """
         netlist = []
-        conn = {}
-        for input, c in zip(self.input_pins, self.children):
-            if isinstance(c, Node):
-                conn[input] = c.output_signal
-            else:
-                conn[input] = c
-
-        conn[self.output_pin] = self.output_signal if out is None else out
-        netlist.append((self.cell_name,conn, self.node_id))
-        for c in self.children:
-            if isinstance(c, Node):
-                netlist += c.to_netlist()
-        return netlist
\ No newline at end of file
+        for node in pre_order(self):
+            if not isinstance(node, Node):
+                continue
+            conn = {}
+            for input, c in zip(node.input_pins, node.children):
+                if isinstance(c, Node):
+                    conn[input] = c.output_signal
+                else:
+                    conn[input] = c
+            conn[node.output_pin] = out if node is self and out is not None else node.output_signal
+            netlist.append((node.cell_name,conn, node.node_id))
+        return netlist
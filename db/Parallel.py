@@ -0,0 +1,118 @@
+"""
+Equivalence checks on a process pool.
+Exhaustive checks are split into contiguous ranges of the input space and every range
+runs the bit-parallel kernel in its own worker. Simulators are sent to the workers
+as plain programs, and the first mismatch found cancels all other workers.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from utils.PrettyStream import *
+from db.Patterns import PatternSource
+from db.Simulator import find_mismatch
+
+# Checks with fewer patterns are not split, starting workers costs more than simulating them
+MIN_SHARD_PATTERNS = 1 << 18
+# Number of ranges per worker, so fast ranges do not leave workers idle
+SHARDS_PER_WORKER = 4
+
+_cancel = None
+
+def _init_worker(cancel):
+    global _cancel
+    _cancel = cancel
+
+def _run_check(task):
+    """
+    Run one check in a worker. A task is (key, sim, other, pairs, shard) where shard
+    is (names, start, stop) for a range of exhaustive patterns, or None to compare BDDs
+    """
+    key, sim, other, pairs, shard = task
+    if _cancel.is_set():
+        return key, None
+    if shard is None:
+        from db.BDD import find_bdd_mismatch, BDDOverflow
+        try:
+            return key, find_bdd_mismatch(sim, other, pairs)
+        except BDDOverflow as e:
+            return key, e
+    names, start, stop = shard
+    return key, find_mismatch(sim, other, pairs, PatternSource(names, start, stop), cancel=_cancel)
+
+def pool_context():
+    """
+    Prefer fork so scripts without a __main__ guard are not run again by the workers
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+def run_checks(checks, workers=None):
+    """
+    Run equivalence checks on a process pool and stop at the first mismatch.
+
+    Args:
+        checks (list): Tuples (key, sim, other, pairs, names), where names are the inputs to
+                       enumerate exhaustively, or None to compare the outputs with BDDs
+        workers (int): Number of worker processes, all cores if None
+    Returns:
+        tuple: (key, mismatch) for the first failing check, where mismatch is (output pair, env)
+               or the BDDOverflow that stopped a BDD comparison. None if all checks pass.
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = []
+    for key, sim, other, pairs, names in checks:
+        if names is None:
+            tasks.append((key, sim, other, pairs, None))
+            continue
+        patterns = PatternSource(names)
+        n_shards = workers * SHARDS_PER_WORKER if len(patterns) >= MIN_SHARD_PATTERNS else 1
+        for shard in patterns.shard(n_shards):
+            tasks.append((key, sim, other, pairs, (shard.names, shard.start, shard.stop)))
+    vprint(f"Running {len(tasks)} equivalence tasks on {workers} workers", v=DEBUG)
+    context = pool_context()
+    cancel = context.Event()
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(cancel,)) as pool:
+        pending = {pool.submit(_run_check, task) for task in tasks}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, result = future.result()
+                if result is not None:
+                    cancel.set()
+                    for f in pending:
+                        f.cancel()
+                    return key, result
+    return None
+
+def outputs_eq(db, other, workers=None):
+    """
+    Compare every driven output of two databases, with the checks of all outputs
+    fanned out to one process pool.
+
+    Returns:
+        bool: True if all outputs are equivalent
+    """
+    from db.Simulator import Simulator, exhaustive_limit
+    from db.BDD import BDDOverflow
+    from db.Equivalence import remember_counterexample
+    checks = []
+    for output in sorted(db.outputs):
+        tree = db.vars[output]
+        if tree is None:
+            continue
+        mine = Simulator({"out": tree}, db)
+        theirs = Simulator({"out": other.vars[output]}, other)
+        names = list(dict.fromkeys(mine.inputs + theirs.inputs))
+        names = names if len(names) <= exhaustive_limit(workers) else None
+        checks.append((output, mine, theirs, [("out", "out")], names))
+    result = run_checks(checks, workers)
+    if result is None:
+        return True
+    output, mismatch = result
+    if isinstance(mismatch, BDDOverflow):
+        err_msg(f'Skipping logical equivalence check of output {output}: {mismatch}')
+        return False
+    remember_counterexample(mismatch[1])
+    vprint(f"Output {output} failed on pattern {mismatch[1]}", v=FAILED)
+    return False
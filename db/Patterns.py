@@ -0,0 +1,106 @@
+"""
+Lazy sources of exhaustive input patterns.
+Patterns are produced on demand, either as environments or packed into words for
+the bit-parallel engines, so no check ever holds all 2^n patterns in memory.
+"""
+
+# Number of inputs enumerated inside a single packed word (2^16 patterns per word)
+CHUNK_BITS = 16
+# Pattern sources up to this size print their patterns, larger ones print a summary
+REPR_LIMIT = 256
+
+def exhaustive_word(i, width):
+    """
+    Returns the packed word of input i when enumerating patterns 0..width-1,
+    where pattern j assigns bit i of j to input i
+    """
+    period = 1 << (i + 1)
+    word = ((1 << (1 << i)) - 1) << (1 << i)
+    while period < width:
+        word |= word << period
+        period <<= 1
+    return word & ((1 << width) - 1)
+
+class PatternSource:
+    """
+    All input patterns over a list of names, or a contiguous range of them.
+    Pattern j assigns bit n-1-k of j to names[k], so patterns come in the same order
+    as itertools.product([0, 1], repeat=n) with the first name changing slowest.
+    """
+    def __init__(self, names, start=0, stop=None):
+        """
+        Args:
+            names (list): Input names
+            start (int): First pattern of the range
+            stop (int): End of the range (exclusive), all 2^n patterns if None
+        """
+        self.names = list(names)
+        self.start = start
+        self.stop = (1 << len(self.names)) if stop is None else stop
+        if not 0 <= self.start <= self.stop <= 1 << len(self.names):
+            raise ValueError(f"Invalid pattern range [{start}, {stop}) for {len(self.names)} inputs")
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        for pattern in range(self.start, self.stop):
+            yield self.env(pattern)
+
+    def __repr__(self):
+        if len(self) <= REPR_LIMIT:
+            return repr(list(self))
+        return f"PatternSource({self.names}, {self.start}, {self.stop})"
+
+    def env(self, pattern):
+        """
+        Converts a pattern index back into an input environment
+        """
+        n = len(self.names)
+        return {name: (pattern >> (n - 1 - k)) & 1 for k, name in enumerate(self.names)}
+
+    def words(self, chunk_bits=CHUNK_BITS):
+        """
+        Enumerate the patterns packed into words of up to 2^chunk_bits patterns.
+        Yields tuples (base, width, words) where bit j of words[name] holds the value
+        of name in pattern base + j
+        """
+        n = len(self.names)
+        low = min(n, chunk_bits)
+        full = 1 << low
+        # names[k] takes bit n-1-k of the pattern index
+        low_words = [exhaustive_word(i, full) for i in range(low)]
+        for block in range(self.start - self.start % full, self.stop, full):
+            lo = max(block, self.start)
+            hi = min(block + full, self.stop)
+            width = hi - lo
+            mask = (1 << width) - 1
+            words = {}
+            for k, name in enumerate(self.names):
+                i = n - 1 - k
+                if i < low:
+                    words[name] = (low_words[i] >> (lo - block)) & mask
+                else:
+                    words[name] = mask if (block >> i) & 1 else 0
+            yield lo, width, words
+
+    def shard(self, n_shards, chunk_bits=CHUNK_BITS):
+        """
+        Split the range into at most n_shards contiguous ranges of about equal size,
+        aligned to whole words of 2^chunk_bits patterns where possible
+        """
+        full = 1 << min(len(self.names), chunk_bits)
+        size = -(-len(self) // max(1, n_shards))
+        size = max(full, -(-size // full) * full)
+        return [PatternSource(self.names, lo, min(lo + size, self.stop))
+                for lo in range(self.start, self.stop, size)]
+
+    def first(self, predicate):
+        """
+        Returns the first environment for which predicate is true, or None.
+        Patterns after the match are never generated.
+        """
+        for env in self:
+            if predicate(env):
+                return env
+        return None
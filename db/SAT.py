@@ -0,0 +1,333 @@
+import heapq
+from utils.PrettyStream import *
+
+# Literals are 2*var + sign, where sign 1 is the negated literal.
+# This matches the literal encoding of NandGraph, so gate i maps to variable i.
+
+def luby(i):
+    """
+    The i-th element (starting at 0) of the Luby restart sequence 1,1,2,1,1,2,4,...
+    """
+    size = 1
+    seq = 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i = i % size
+    return 1 << seq
+
+class Clause:
+    __slots__ = ("lits", "learnt", "lbd", "deleted")
+
+    def __init__(self, lits, learnt=False, lbd=0):
+        self.lits = lits
+        self.learnt = learnt
+        self.lbd = lbd
+        self.deleted = False
+
+class Solver:
+    """
+    A conflict-driven clause learning SAT solver.
+
+    - Two watched literals per clause for unit propagation
+    - First-UIP clause learning with non-chronological backjumping
+    - VSIDS decision heuristic with phase saving
+    - Luby restarts and periodic deletion of learnt clauses with high LBD
+    - Solving under assumptions, so one encoding can answer several queries
+    """
+    RESTART_BASE = 100
+    VAR_DECAY = 0.95
+
+    def __init__(self):
+        self.n_vars = 0
+        self.values = []
+        self.level = []
+        self.reason = []
+        self.activity = []
+        self.phase = []
+        self.watches = []
+        self.clauses = []
+        self.learnts = []
+        self.trail = []
+        self.trail_lim = []
+        self.qhead = 0
+        self.heap = []
+        self.var_inc = 1.0
+        self.ok = True
+        self.conflicts = 0
+        self.max_learnts = 4000
+
+    def new_var(self):
+        var = self.n_vars
+        self.n_vars += 1
+        self.values.append(-1)
+        self.level.append(0)
+        self.reason.append(None)
+        self.activity.append(0.0)
+        self.phase.append(1)
+        self.watches.append([])
+        self.watches.append([])
+        heapq.heappush(self.heap, (0.0, var))
+        return var
+
+    def value(self, lit):
+        """
+        Returns 1 if lit is true, 0 if false, -1 if unassigned
+        """
+        v = self.values[lit >> 1]
+        return v if v < 0 else v ^ (lit & 1)
+
+    def model_value(self, var):
+        return self.values[var]
+
+    def decision_level(self):
+        return len(self.trail_lim)
+
+    def add_clause(self, lits):
+        """
+        Add a problem clause, returns False if the formula became trivially unsatisfiable
+        """
+        if not self.ok:
+            return False
+        if self.decision_level() > 0:
+            self.cancel_until(0)
+        lits = sorted(set(lits))
+        clause = []
+        for lit in lits:
+            if lit ^ 1 in lits or self.value(lit) == 1:
+                return True
+            if self.value(lit) == -1:
+                clause.append(lit)
+        if not clause:
+            self.ok = False
+            return False
+        if len(clause) == 1:
+            self.enqueue(clause[0], None)
+            self.ok = self.propagate() is None
+            return self.ok
+        c = Clause(clause)
+        self.clauses.append(c)
+        self.watches[clause[0]].append(c)
+        self.watches[clause[1]].append(c)
+        return True
+
+    def enqueue(self, lit, reason):
+        var = lit >> 1
+        self.values[var] = (lit & 1) ^ 1
+        self.level[var] = self.decision_level()
+        self.reason[var] = reason
+        self.trail.append(lit)
+
+    def propagate(self):
+        """
+        Unit propagation with two watched literals. Watch lists are indexed by the
+        watched literal and visited when that literal becomes false.
+        Returns a conflicting clause or None.
+        """
+        values = self.values
+        while self.qhead < len(self.trail):
+            false_lit = self.trail[self.qhead] ^ 1
+            self.qhead += 1
+            watchers = self.watches[false_lit]
+            kept = []
+            conflict = None
+            i = 0
+            n = len(watchers)
+            while i < n:
+                c = watchers[i]
+                i += 1
+                if c.deleted:
+                    continue
+                lits = c.lits
+                if lits[0] == false_lit:
+                    lits[0], lits[1] = lits[1], false_lit
+                first = lits[0]
+                v = values[first >> 1]
+                if v >= 0 and v ^ (first & 1) == 1:
+                    kept.append(c)
+                    continue
+                # Look for a new literal to watch
+                for k in range(2, len(lits)):
+                    lk = lits[k]
+                    vk = values[lk >> 1]
+                    if vk < 0 or vk ^ (lk & 1) == 1:
+                        lits[1], lits[k] = lk, false_lit
+                        self.watches[lk].append(c)
+                        break
+                else:
+                    kept.append(c)
+                    if v >= 0:
+                        conflict = c
+                        kept.extend(watchers[i:])
+                        break
+                    self.enqueue(first, c)
+            self.watches[false_lit] = kept
+            if conflict is not None:
+                self.qhead = len(self.trail)
+                return conflict
+        return None
+
+    def bump(self, var):
+        self.activity[var] += self.var_inc
+        if self.activity[var] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.var_inc *= 1e-100
+            self.heap = [(-self.activity[v], v) for v in range(self.n_vars) if self.values[v] < 0]
+            heapq.heapify(self.heap)
+        elif self.values[var] < 0:
+            heapq.heappush(self.heap, (-self.activity[var], var))
+
+    def analyze(self, conflict):
+        """
+        First-UIP conflict analysis.
+        Returns the learnt clause (asserting literal first) and the backjump level.
+        """
+        seen = set()
+        learnt = [None]
+        counter = 0
+        lit = None
+        index = len(self.trail) - 1
+        clause = conflict
+        current = self.decision_level()
+        while True:
+            for q in clause.lits if lit is None else clause.lits[1:]:
+                var = q >> 1
+                if var not in seen and self.level[var] > 0:
+                    seen.add(var)
+                    self.bump(var)
+                    if self.level[var] >= current:
+                        counter += 1
+                    else:
+                        learnt.append(q)
+            while self.trail[index] >> 1 not in seen:
+                index -= 1
+            lit = self.trail[index]
+            index -= 1
+            clause = self.reason[lit >> 1]
+            seen.discard(lit >> 1)
+            counter -= 1
+            if counter == 0:
+                break
+        learnt[0] = lit ^ 1
+        # Drop literals implied by the rest of the clause
+        marked = {q >> 1 for q in learnt}
+        minimized = [learnt[0]]
+        for q in learnt[1:]:
+            r = self.reason[q >> 1]
+            if r is None or any(p >> 1 not in marked and self.level[p >> 1] > 0 for p in r.lits[1:]):
+                minimized.append(q)
+        learnt = minimized
+        if len(learnt) == 1:
+            return learnt, 0
+        # Put the literal with the highest level second so it gets watched
+        best = max(range(1, len(learnt)), key=lambda k: self.level[learnt[k] >> 1])
+        learnt[1], learnt[best] = learnt[best], learnt[1]
+        return learnt, self.level[learnt[1] >> 1]
+
+    def cancel_until(self, level):
+        if self.decision_level() <= level:
+            return
+        start = self.trail_lim[level]
+        for k in range(len(self.trail) - 1, start - 1, -1):
+            var = self.trail[k] >> 1
+            self.phase[var] = self.values[var]
+            self.values[var] = -1
+            self.reason[var] = None
+            heapq.heappush(self.heap, (-self.activity[var], var))
+        del self.trail[start:]
+        del self.trail_lim[level:]
+        self.qhead = len(self.trail)
+        if len(self.heap) > 8 * self.n_vars:
+            self.heap = [(-self.activity[v], v) for v in range(self.n_vars) if self.values[v] < 0]
+            heapq.heapify(self.heap)
+
+    def pick_branch(self):
+        while self.heap:
+            _, var = heapq.heappop(self.heap)
+            if self.values[var] < 0:
+                return 2 * var + (self.phase[var] ^ 1)
+        return None
+
+    def reduce_learnts(self):
+        """
+        Delete the half of learnt clauses with the highest LBD that are not reasons
+        """
+        locked = {id(self.reason[lit >> 1]) for lit in self.trail if self.reason[lit >> 1] is not None}
+        self.learnts.sort(key=lambda c: c.lbd)
+        keep = len(self.learnts) // 2
+        for c in self.learnts[keep:]:
+            if id(c) not in locked and len(c.lits) > 2:
+                c.deleted = True
+        self.learnts = [c for c in self.learnts if not c.deleted]
+
+    def solve(self, assumptions=()):
+        """
+        Solve the formula under a list of assumed literals.
+
+        Returns:
+            bool: True if satisfiable, the model is then available through model_value
+        """
+        if not self.ok:
+            return False
+        self.cancel_until(0)
+        if self.propagate() is not None:
+            self.ok = False
+            return False
+        restart = 0
+        while True:
+            budget = Solver.RESTART_BASE * luby(restart)
+            restart += 1
+            result = self.search(budget, assumptions)
+            if result is not None:
+                return result
+            vprint(f"Restart after {self.conflicts} conflicts", v=ALL)
+
+    def search(self, budget, assumptions):
+        conflicts = 0
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                conflicts += 1
+                if self.decision_level() == 0:
+                    self.ok = False
+                    return False
+                learnt, back_level = self.analyze(conflict)
+                self.cancel_until(back_level)
+                if len(learnt) == 1:
+                    self.enqueue(learnt[0], None)
+                else:
+                    lbd = len({self.level[q >> 1] for q in learnt})
+                    c = Clause(learnt, learnt=True, lbd=lbd)
+                    self.learnts.append(c)
+                    self.watches[learnt[0]].append(c)
+                    self.watches[learnt[1]].append(c)
+                    self.enqueue(learnt[0], c)
+                self.var_inc /= Solver.VAR_DECAY
+                continue
+            if conflicts >= budget:
+                self.cancel_until(0)
+                return None
+            if len(self.learnts) - len(self.trail) >= self.max_learnts:
+                self.reduce_learnts()
+                self.max_learnts = int(self.max_learnts * 1.1)
+            lit = None
+            while self.decision_level() < len(assumptions):
+                a = assumptions[self.decision_level()]
+                if self.value(a) == 1:
+                    self.trail_lim.append(len(self.trail))
+                elif self.value(a) == 0:
+                    self.cancel_until(0)
+                    return False
+                else:
+                    lit = a
+                    break
+            if lit is None:
+                lit = self.pick_branch()
+                if lit is None:
+                    return True
+            self.trail_lim.append(len(self.trail))
+            self.enqueue(lit, None)
@@ -0,0 +1,169 @@
+from numbers import Number
+from db.Node import Node
+from db.Traversal import topological, resolve
+from db.Patterns import CHUNK_BITS
+
+# Largest number of inputs we are willing to enumerate exhaustively
+EXHAUSTIVE_LIMIT = 20
+# Limit when the patterns are split across a process pool
+PARALLEL_EXHAUSTIVE_LIMIT = 26
+
+# Bitwise implementations of common truth tables, keyed by (arity, truth table).
+# Input i of a gate selects bit i of the truth table index.
+FAST_OPS = {
+    (0, 0b0):    lambda m: 0,
+    (0, 0b1):    lambda m: m,
+    (1, 0b10):   lambda m, a: a,
+    (1, 0b01):   lambda m, a: m ^ a,
+    (2, 0b1000): lambda m, a, b: a & b,
+    (2, 0b0111): lambda m, a, b: m ^ (a & b),
+    (2, 0b1110): lambda m, a, b: a | b,
+    (2, 0b0001): lambda m, a, b: m ^ (a | b),
+    (2, 0b0110): lambda m, a, b: a ^ b,
+    (2, 0b1001): lambda m, a, b: m ^ a ^ b,
+}
+
+def eval_table(table, mask, *fanins):
+    """
+    Bitwise evaluation of an arbitrary truth table as a sum of minterms
+    """
+    result = 0
+    for j in range(1 << len(fanins)):
+        if (table >> j) & 1:
+            term = mask
+            for i, w in enumerate(fanins):
+                term &= w if (j >> i) & 1 else mask ^ w
+            result |= term
+    return result
+
+def pack_patterns(envs, names):
+    """
+    Packs a list of environments into one word per input name
+    """
+    words = {name: 0 for name in names}
+    for j, env in enumerate(envs):
+        for name in names:
+            if env[name]:
+                words[name] |= 1 << j
+    return words
+
+class Simulator:
+    """
+    Levelized bit-parallel simulator for Node trees.
+    The trees are flattened once into a straight-line program over integer slots,
+    each slot holds a packed word where bit j is the value of the signal in pattern j.
+    Leaf strings naming other variables of db are resolved to their trees.
+    """
+    def __init__(self, roots, db=None):
+        """
+        Args:
+            roots (dict): Mapping from output name to Node
+            db (TinyDB): Database used to resolve leaves naming other variables
+        """
+        self.db = db
+        self.inputs = []
+        self.program = []
+        self.outputs = {}
+        self.n_slots = 0
+        self.input_slots = {}
+        self._node_slots = {}
+        self._const_slots = {}
+        for node in topological(roots.values(), db):
+            fanins = tuple(self._leaf_slot(c) for c in node.children)
+            slot = self._new_slot()
+            self.program.append((slot, len(fanins), type(node).truth_table(), fanins))
+            # Keep a reference to the node so its id stays unique while we hold the slot
+            self._node_slots[id(node)] = (slot, node)
+        for name, root in roots.items():
+            self.outputs[name] = self._leaf_slot(root)
+
+    @classmethod
+    def from_db(cls, db):
+        """
+        Build a simulator for all driven outputs of a database, including outputs
+        assigned a plain signal or a constant
+        """
+        roots = {o: db.vars[o] for o in db.outputs if db.vars.get(o) is not None}
+        return cls(roots, db)
+
+    def __getstate__(self):
+        # Only the program is needed to simulate, the trees stay in this process
+        state = self.__dict__.copy()
+        state["db"] = None
+        state["_node_slots"] = {}
+        return state
+
+    def _new_slot(self):
+        self.n_slots += 1
+        return self.n_slots - 1
+
+    def _leaf_slot(self, leaf):
+        leaf = resolve(leaf, self.db)
+        if isinstance(leaf, Node):
+            return self._node_slots[id(leaf)][0]
+        if isinstance(leaf, Number):
+            value = int(bool(leaf))
+            if value not in self._const_slots:
+                slot = self._new_slot()
+                self.program.append((slot, 0, value, ()))
+                self._const_slots[value] = slot
+            return self._const_slots[value]
+        if leaf not in self.input_slots:
+            self.input_slots[leaf] = self._new_slot()
+            self.inputs.append(leaf)
+        return self.input_slots[leaf]
+
+    def run(self, words, width):
+        """
+        Simulate width patterns at once.
+
+        Args:
+            words (dict): Mapping from input name to packed word
+            width (int): Number of patterns packed in each word
+        Returns:
+            dict: Mapping from output name to packed word
+        """
+        mask = (1 << width) - 1
+        values = [0] * self.n_slots
+        for name, slot in self.input_slots.items():
+            if name not in words:
+                raise ValueError(f"Insufficient env: variable {name} undefined")
+            values[slot] = words[name] & mask
+        for slot, arity, table, fanins in self.program:
+            op = FAST_OPS.get((arity, table))
+            args = [values[f] for f in fanins]
+            if op is not None:
+                values[slot] = op(mask, *args)
+            else:
+                values[slot] = eval_table(table, mask, *args)
+        return {name: values[slot] for name, slot in self.outputs.items()}
+
+def exhaustive_limit(workers=1):
+    """
+    Largest number of inputs checked exhaustively with the given number of workers
+    """
+    return EXHAUSTIVE_LIMIT if workers == 1 else PARALLEL_EXHAUSTIVE_LIMIT
+
+def find_mismatch(sim, other, pairs, patterns, chunk_bits=CHUNK_BITS, cancel=None):
+    """
+    Exhaustively compare outputs of two simulators over a source of patterns.
+    Stops at the first word containing a mismatch.
+
+    Args:
+        pairs (list): List of (output of sim, output of other) to compare
+        patterns (PatternSource): Patterns to compare on
+        cancel (Event): Give up between words once this event is set
+    Returns:
+        tuple: (output pair, env) of the first mismatch, or None if all patterns match
+    """
+    for base, width, words in patterns.words(chunk_bits):
+        if cancel is not None and cancel.is_set():
+            return None
+        mine = sim.run(words, width)
+        theirs = other.run(words, width)
+        for a, b in pairs:
+            diff = mine[a] ^ theirs[b]
+            if diff:
+                pattern = base + (diff & -diff).bit_length() - 1
+                return (a, b), patterns.env(pattern)
+    return None
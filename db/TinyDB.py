@@ -1,8 +1,46 @@
+from numbers import Number
 from utils.PrettyStream import FAILED, PASSED, PrettyStream, err_msg, vprint, QUIET, INFO, VERBOSE, DEBUG, ALL
 from db.Node import *
 from db.LogicNodes import *
 from db.IOPort import *
 from db.Routing import Net
+from db.Traversal import topological, levelized, leaf_value, resolve
+
+class VarDict(dict):
+    """
+    Dictionary of variables that counts its modifications, so cached views of the
+    database can tell when they are stale. Direct assignments such as
+    db.vars[name] = tree are tracked too. Edits made inside existing trees are not.
+    """
+    revision = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.revision += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.revision += 1
+
+    def pop(self, *args):
+        self.revision += 1
+        return super().pop(*args)
+
+    def popitem(self):
+        self.revision += 1
+        return super().popitem()
+
+    def clear(self):
+        super().clear()
+        self.revision += 1
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.revision += 1
+
+    def setdefault(self, key, default=None):
+        self.revision += 1
+        return super().setdefault(key, default)
 
 class TinyDB:
     """
@@ -16,7 +54,7 @@ class TinyDB:
         self.name = name
         self.inputs = set()
         self.outputs = set()
-        self.vars = {}
+        self.vars = VarDict()
         self.ports = {}
 
         self.node_registry = {}
@@ -24,6 +62,19 @@ class TinyDB:
         self.nets = {}
         self.die_area = None
 
+        self._order_cache = {}
+        # Resolution index: direct leaves, readers and memoized support of each variable
+        self._leaves = {}
+        self._readers = {}
+        self._support = {}
+        self._index_revision = 0
+
+    def __getstate__(self):
+        # Cached views hold compiled functions, rebuild them after unpickling
+        state = self.__dict__.copy()
+        state["_order_cache"] = {}
+        return state
+
     def set_die_area(self, half_width, half_height):
         """
         Sets the grid size we are working with for the standard cells
@@ -40,21 +91,137 @@ class TinyDB:
         """
         Register a node in teh node registry
         """
-        if isinstance(node, Node):
-            self.node_registry[node.node_id] = node
-            for child in node.children:
-                if isinstance(child, Node):
-                    self._register_node(child)
+        for n in topological([node]):
+            self.node_registry[n.node_id] = n
     
     def _unregister_node(self, node):
         """
         Unregister a node and its children from the node registry
         """
-        if isinstance(node, Node) and node.node_id in self.node_registry:
-            del self.node_registry[node.node_id]
-            for child in node.children:
-                if isinstance(child, Node):
-                    self._unregister_node(child)
+        for n in topological([node]):
+            self.node_registry.pop(n.node_id, None)
+
+    @property
+    def revision(self):
+        """
+        Counter that changes whenever a variable of the database is assigned
+        """
+        return self.vars.revision
+
+    def _cached(self, key, build):
+        """
+        Return a view of the database cached until the next change of revision
+        """
+        cached = self._order_cache.get(key)
+        if cached is None or cached[0] != self.revision:
+            cached = (self.revision, build())
+            self._order_cache[key] = cached
+        return cached[1]
+
+    def topological_order(self):
+        """
+        All nodes of the database, each once, with fanins (including variables
+        referenced by name) before their fanouts. Cached until the database changes.
+        """
+        return self._cached("topological", lambda: topological(self.vars.values(), self))
+
+    def levelized_order(self):
+        """
+        All nodes of the database grouped by logic level. Cached until the database changes.
+        """
+        return self._cached("levelized", lambda: levelized(self.vars.values(), self))
+
+    def _sync_index(self):
+        """
+        Drop the resolution index if variables were assigned behind its back
+        """
+        if self._index_revision != self.revision:
+            self._leaves.clear()
+            self._readers.clear()
+            self._support.clear()
+            self._index_revision = self.revision
+
+    def _var_leaves(self, var_name):
+        """
+        Leaf strings appearing directly in the tree of a variable, or the signal
+        a variable assigned another signal names
+        """
+        leaves = self._leaves.get(var_name)
+        if leaves is None:
+            leaves = set()
+            tree = self.vars.get(var_name)
+            if isinstance(tree, Node):
+                for node in topological([tree]):
+                    for c in node.children:
+                        if isinstance(c, str):
+                            leaves.add(c)
+            elif isinstance(tree, str) and tree != var_name:
+                leaves.add(tree)
+            for leaf in leaves:
+                self._readers.setdefault(leaf, set()).add(var_name)
+            self._leaves[var_name] = leaves
+        return leaves
+
+    def _invalidate(self, var_name):
+        """
+        Forget the support of a variable and of every variable reading it
+        """
+        self._leaves.pop(var_name, None)
+        self._support.pop(var_name, None)
+        stack = [var_name]
+        while stack:
+            name = stack.pop()
+            for reader in self._readers.get(name, ()):
+                if self._support.pop(reader, None) is not None:
+                    stack.append(reader)
+
+    def support(self, var_name):
+        """
+        The input signals a variable depends on, following references to other variables
+        and variables assigned another signal or a constant, as resolve does.
+        Supports are memoized per variable, so every further reference costs a lookup.
+
+        Returns:
+            frozenset: Leaf strings that do not name a variable with logic or a constant
+        """
+        self._sync_index()
+        stack = [(var_name, False)]
+        visiting = set()
+        while stack:
+            name, expanded = stack.pop()
+            if name in self._support:
+                continue
+            tree = self.vars.get(name)
+            if isinstance(tree, str) and tree != name:
+                tree = resolve(name, self)
+                if not isinstance(tree, Node):
+                    # Aliases of an input, of an undriven signal or of each other in a cycle
+                    self._var_leaves(name)
+                    self._support[name] = frozenset([tree] if isinstance(tree, str) else [])
+                    continue
+            leaves = self._var_leaves(name)
+            refs = [l for l in leaves if self.vars.get(l) is not None and self.vars[l] != l]
+            if expanded:
+                visiting.discard(name)
+                support = set()
+                for leaf in leaves:
+                    if leaf in self._support:
+                        support |= self._support[leaf]
+                    else:
+                        support.add(leaf)
+                self._support[name] = frozenset(support)
+                continue
+            if not isinstance(tree, Node):
+                self._support[name] = frozenset([] if isinstance(tree, Number) else [name])
+                continue
+            visiting.add(name)
+            stack.append((name, True))
+            for ref in refs:
+                if ref in visiting:
+                    raise ValueError(f"Combinational loop through {ref}")
+                if ref not in self._support:
+                    stack.append((ref, False))
+        return self._support[var_name]
 
     def add_var(self, var_name, expr = None):
         """
@@ -70,7 +237,11 @@ class TinyDB:
         # Check if we are updating a placeholder (like an output defined before its logic).
         is_update = var_name in self.vars and self.vars[var_name] is None
         # Assign the expression to the variable.
+        indexed = self._index_revision == self.revision
         self.vars[var_name] = expr
+        if indexed:
+            self._invalidate(var_name)
+            self._index_revision = self.revision
         if isinstance(expr, Node):
             self._register_node(expr)
         if is_update:
@@ -223,6 +394,13 @@ class TinyDB:
             new_db.add_output(out)
         return new_db
 
+    def to_graph(self):
+        """
+        Convert the database to a structurally hashed NandGraph
+        """
+        from db.NandGraph import NandGraph
+        return NandGraph.from_db(self)
+
     def to_json(self):
         """
         Serialize the database to a JSON object for debugging
@@ -238,15 +416,25 @@ class TinyDB:
         self.name = json["name"]
 
     def get_all_input_pattern(self):
-        input_set = self.inputs
-        input_patterns = product([0, 1], repeat=len(input_set))
-        input_envs = [dict(zip(list(input_set), bits)) for bits in input_patterns]
-        return input_envs
+        """
+        Returns a lazy PatternSource over all patterns of the inputs
+        """
+        from db.Patterns import PatternSource
+        return PatternSource(sorted(self.inputs))
 
-    def logical_eq(self, other):
+    def logical_eq(self, other, method="auto", workers=1):
         """
         Compares two libraries for logical equivalence.
-        """
+
+        Args:
+            other (TinyDB): The database to compare against
+            method (str): "auto" compares each output tree by exhaustive simulation or BDDs,
+                          "sat" proves all outputs at once on a SAT miter
+            workers (int): Worker processes for the "auto" comparisons, None uses every core.
+                           With more than one, all outputs are checked in parallel.
+        """
+        if method not in ("auto", "sat"):
+            raise ValueError(f"Unknown equivalence method {method}")
         vprint("Comparing database equivalence", v=VERBOSE)
         for output in self.outputs:
             if output not in other.outputs:
@@ -259,19 +447,61 @@ class TinyDB:
             if (tree is None) ^ (other.vars[output] is None):
                 vprint(f'Output {output} is not driven in a database', v=VERBOSE)
                 vprint("Databases are not logically equivalent", v=FAILED)
+                return False
+        from db.Equivalence import simulation_counterexample, sat_counterexample, trees_eq
+        mismatch = simulation_counterexample(self, other)
+        if mismatch is not None:
+            vprint(f"Output {mismatch[0]} differs on {mismatch[1]}", v=VERBOSE)
+            vprint("Databases are not logically equivalent", v=FAILED)
+            return False
+        if method == "auto" and workers != 1:
+            from db.Parallel import outputs_eq
+            if not outputs_eq(self, other, workers):
+                vprint("Databases are not logically equivalent", v=FAILED)
+                return False
+        for output in self.outputs:
+            tree = self.vars[output]
+            if tree is None or method != "auto" or workers != 1:
+                continue
             vprint(f"Comparing output {output}",v=VERBOSE)
-            if not tree.logical_eq(other.vars[output],self,other):
+            # Outputs may also be assigned a plain signal or a constant
+            if not trees_eq(tree, other.vars[output], self, other):
                 vprint("Databases are not logically equivalent", v=FAILED)
                 return False
+        if method == "sat" and sat_counterexample(self, other) is not None:
+            vprint("Databases are not logically equivalent", v=FAILED)
+            return False
         vprint("Databases are logically equivalent", v=PASSED)
         return True
+
+    def find_counterexample(self, other):
+        """
+        Search for an input assignment on which an output of the two databases differs.
+        Random simulation and cached counterexamples are tried first, then a SAT miter is solved.
+
+        Returns:
+            dict: An input environment that can be replayed with eval(), or None if
+                  all common outputs are equivalent
+        """
+        from db.Equivalence import sat_counterexample, simulation_counterexample
+        result = simulation_counterexample(self, other)
+        if result is None:
+            result = sat_counterexample(self, other)
+        if result is None:
+            return None
+        output, env = result
+        vprint(f"Output {output} differs on {env}", v=FAILED)
+        return env
     
     def eval(self, env_dict=None, db=None,**env):
         """
         Evaluate the database given an environment
         """
         env = env if env_dict is None else env_dict
+        db = self if db is None else db
         result = {}
+        # One value cache for all outputs, so logic shared through variables is evaluated once
+        values = {}
         for output in self.outputs:
             if output in env:
                 err_msg(f"Output {output} conflicts with the environment {env}")
@@ -279,8 +509,101 @@ class TinyDB:
             if output not in self.vars or self.vars[output] is None:
                 result[output] = "Undriven"
             else:
-                result[output] = self.vars[output].eval(env, db)
+                result[output] = leaf_value(self.vars[output], env, db, values)
         return result
+
+    def compile(self):
+        """
+        Compile the database into a straight-line Python function, see db.Compiler.
+        The function is cached until the database changes.
+        """
+        from db.Compiler import compile_db
+        return self._cached("compiled", lambda: compile_db(self))
+
+    def eval_batch(self, inputs, chunk=1 << 16):
+        """
+        Evaluate the database on many input vectors at once with NumPy.
+        Vectors are packed 64 to a word and the compiled database runs every gate
+        as one bulk bitwise operation over the packed arrays.
+
+        Args:
+            inputs: A 2D array with one row per vector and one column per input in the
+                    order of compile().inputs, or a dict mapping input names to 1D arrays
+            chunk (int): Number of vectors evaluated at once, bounds the memory held per signal
+        Returns:
+            For an array, a 2D boolean array with one column per output in the order of
+            compile().outputs. For a dict, a dict mapping outputs to 1D boolean arrays,
+            with "Undriven" for undriven outputs.
+        """
+        import numpy as np
+        func = self.compile()
+        undriven = [o for o in func.outputs if self.vars.get(o) is None]
+        if isinstance(inputs, dict):
+            columns = {name: np.asarray(v).astype(bool).ravel() for name, v in inputs.items()}
+            lengths = {len(c) for c in columns.values()}
+            if len(lengths) > 1:
+                raise ValueError(f"Input arrays have different lengths {sorted(lengths)}")
+            n = lengths.pop() if lengths else 0
+        else:
+            array = np.asarray(inputs)
+            if array.ndim != 2 or array.shape[1] != len(func.inputs):
+                raise ValueError(f"Expected an array of shape (N, {len(func.inputs)}), got {array.shape}")
+            columns = {name: array[:, i].astype(bool) for i, name in enumerate(func.inputs)}
+            n = array.shape[0]
+            if undriven:
+                err_msg(f"Outputs {undriven} are undriven")
+                raise ValueError(undriven)
+
+        def pack(column):
+            padded = np.zeros(-(-len(column) // 64) * 64, dtype=bool)
+            padded[:len(column)] = column
+            return np.packbits(padded, bitorder="little").view("<u8")
+
+        def unpack(word, n_words, width):
+            word = np.broadcast_to(np.asarray(word, dtype="<u8"), (n_words,))
+            return np.unpackbits(np.ascontiguousarray(word).view(np.uint8), bitorder="little")[:width].astype(bool)
+
+        chunk = max(64, chunk - chunk % 64)
+        results = {o: [] for o in func.outputs}
+        for start in range(0, n, chunk):
+            width = min(n, start + chunk) - start
+            words = func({name: pack(c[start:start + width]) for name, c in columns.items()}, 64)
+            for output, word in words.items():
+                if not isinstance(word, str):
+                    results[output].append(unpack(word, -(-width // 64), width))
+        outputs = {}
+        for output, parts in results.items():
+            if output in undriven:
+                outputs[output] = "Undriven"
+            else:
+                outputs[output] = np.concatenate(parts) if parts else np.zeros(0, dtype=bool)
+        if isinstance(inputs, dict):
+            return outputs
+        return np.stack([outputs[o] for o in func.outputs], axis=1) if func.outputs else np.zeros((n, 0), dtype=bool)
+
+    def simulate(self, envs):
+        """
+        Evaluate the database on a list of environments at once.
+        All environments are packed into words and simulated in a single bit-parallel pass
+        of the compiled database.
+
+        Args:
+            envs (list): List of input environments
+        Returns:
+            list: List of output dicts, one per environment
+        """
+        from db.Simulator import pack_patterns
+        func = self.compile()
+        width = len(envs)
+        names = [name for name in func.inputs if all(name in env for env in envs)]
+        words = func(pack_patterns(envs, names), width)
+        results = []
+        for j in range(width):
+            result = {}
+            for output, word in words.items():
+                result[output] = word if word == "Undriven" else (word >> j) & 1
+            results.append(result)
+        return results
                 
     def pretty(self, p=PrettyStream()):
         """
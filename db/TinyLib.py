@@ -1,53 +1,229 @@
 from db.Node import *
 from db.LogicNodes import *
 from utils.PrettyStream import *
+import copyreg
+import hashlib
 import json
+import os
+from itertools import permutations
 
-def NodeFactory(cell_name, pins, patterns=[]):
-    inputs_pins = []
-    output_func = None
+# Classes of library cells by cell spec, shared by all libraries of the process
+cell_table = {}
+
+class TruthTable:
+    """
+    Output function of a cell given by its truth table, bit j of the table is the output
+    when input i is set to bit i of j. Unlike a lambda it can be pickled.
+    """
+    def __init__(self, table):
+        self.table = table
+
+    def __call__(self, *inputs):
+        index = 0
+        for i, value in enumerate(inputs):
+            if value:
+                index |= 1 << i
+        return bool((self.table >> index) & 1)
+
+class CellType(type):
+    """
+    Metaclass of library cells. A cell class pickles as its spec and is rebuilt from it,
+    so nodes of library cells can be sent to other processes and cached on disk.
+    """
+
+def cell_spec(cell_name, pins, patterns=[]):
+    """
+    The data describing a cell, with its output function evaluated into a truth table
+
+    Args:
+        pins (dict): Mapping from pin name to "input", or to the Python expression of the
+                     output over the input pins
+    Returns:
+        tuple: (cell name, input pins, output pin, truth table, patterns)
+    """
+    input_pins = tuple(pin for pin, value in pins.items() if value == 'input')
     output_pin = None
-    patterns_evaled = []
-    for pin_name, pin_value in pins.items():
-        if pin_value == 'input':
-            inputs_pins.append(pin_name)
+    table = 0
     for pin_name, pin_value in pins.items():
         if pin_value != 'input':
             output_pin = pin_name
-            output_func = eval(f"lambda {','.join(inputs_pins)}:{pin_value}")
-    for p in patterns:
-        patterns_evaled.append(eval(p,None,{i:i for i in inputs_pins}))
-
-    def __init__(self, *inputs, out=None):
-        super(self.__class__, self).__init__(inputs,out=out)
-                
-    newclass = type(cell_name, (Node,),{"__init__": __init__, 
-                                        "patterns": patterns_evaled, 
-                                        "cell_name": cell_name,
-                                        "input_pins":inputs_pins,
-                                        "output_pin": output_pin,
-                                        "output_func": output_func})
-    
-    vprint(f"Loaded cell {newclass}", v=VERBOSE)
+            table = 0
+            for j in range(1 << len(input_pins)):
+                if eval(pin_value, None, {pin: (j >> i) & 1 for i, pin in enumerate(input_pins)}):
+                    table |= 1 << j
+    return (cell_name, input_pins, output_pin, table, tuple(patterns))
+
+def _init_cell(self, *inputs, out=None):
+    Node.__init__(self, inputs, out=out)
+
+def cell_class(cell_name, input_pins, output_pin, table, patterns):
+    """
+    The class of the cell of a spec, built on first use. Classes are registered by spec,
+    so all libraries and all unpickled nodes of the same cell share one class.
+    """
+    spec = (cell_name, tuple(input_pins), output_pin, table, tuple(patterns))
+    cls = cell_table.get(spec)
+    if cls is None:
+        patterns_evaled = [eval(p, None, {i: i for i in input_pins}) for p in patterns]
+        cls = CellType(cell_name, (Node,), {"__init__": _init_cell,
+                                            "patterns": patterns_evaled,
+                                            "cell_name": cell_name,
+                                            "input_pins": list(input_pins),
+                                            "output_pin": output_pin,
+                                            "output_func": TruthTable(table),
+                                            "_truth_table": table,
+                                            "spec": spec})
+        cell_table[spec] = cls
+    return cls
+
+copyreg.pickle(CellType, lambda cls: (cell_class, cls.spec))
 
+def NodeFactory(cell_name, pins, patterns=[]):
+    newclass = cell_class(*cell_spec(cell_name, pins, patterns))
+    vprint(f"Loaded cell {newclass}", v=VERBOSE)
     return newclass
 
+class PatternIndex:
+    """
+    Matching index over the patterns of a library.
+    Patterns are bucketed by the cell name and arity of their root. Each bucket is a
+    discrimination tree on the gate children of the root: patterns are filed under the
+    sorted cell names of their gate children, which the subject node must all have among
+    its own gate children, since pattern gates never match leaves.
+    """
+    def __init__(self, cells):
+        self.buckets = {}
+        self.size = 0
+        for cell_name, cell in cells.items():
+            for pattern in cell.patterns:
+                if not isinstance(pattern, Node):
+                    continue
+                key = (pattern.cell_name, len(pattern.children))
+                required = tuple(sorted(c.cell_name for c in pattern.children if isinstance(c, Node)))
+                self.buckets.setdefault(key, {}).setdefault(required, []).append((self.size, cell_name, pattern))
+                self.size += 1
+
+    def candidates(self, node):
+        """
+        The patterns that may match node, in library order
+
+        Returns:
+            list: (cell name, pattern) pairs
+        """
+        bucket = self.buckets.get((node.cell_name, len(node.children)))
+        if bucket is None:
+            return []
+        present = sorted(c.cell_name for c in node.children if isinstance(c, Node))
+        # Look up every sub-multiset of the gate children of node
+        keys = {()}
+        for name in present:
+            keys |= {key + (name,) for key in keys}
+        entries = [e for key in keys if key in bucket for e in bucket[key]]
+        entries.sort(key=lambda e: e[0])
+        return [(cell_name, pattern) for _, cell_name, pattern in entries]
+
+def permute_table(table, pins, negated=0):
+    """
+    Truth table of a cell whose input pin i is driven by input pins[i],
+    inverted if bit i of negated is set
+    """
+    arity = len(pins)
+    permuted = 0
+    for j in range(1 << arity):
+        index = 0
+        for i, source in enumerate(pins):
+            index |= (((j >> source) ^ (negated >> i)) & 1) << i
+        permuted |= ((table >> index) & 1) << j
+    return permuted
+
+def npn_transforms(table, arity):
+    """
+    Yields every (table, pins, negated, inverted) obtained from a truth table by permuting
+    its inputs, inverting some of them and inverting the output, as in permute_table
+    """
+    mask = (1 << (1 << arity)) - 1
+    for pins in permutations(range(arity)):
+        for negated in range(1 << arity):
+            permuted = permute_table(table, pins, negated)
+            yield permuted, pins, negated, False
+            yield permuted ^ mask, pins, negated, True
+
+def npn_canonical(table, arity):
+    """
+    NPN canonical form of a truth table: the smallest table among the functions equal
+    to it up to permuting, inverting the inputs and inverting the output
+    """
+    return min(t for t, *_ in npn_transforms(table, arity))
+
+class FunctionIndex:
+    """
+    Boolean matching index of a library, up to NPN equivalence. Maps the truth table of a
+    function of ordered inputs to the cheapest cell computing it once inputs are assigned
+    to pins and some inputs and the output go through inverters.
+    The NPN class of every cell is expanded when the library is loaded, so matching a
+    function is a single lookup and never needs its canonical form.
+    """
+    def __init__(self, cells, costs):
+        # Cheapest inverter, needed for all matches with inverted inputs or output
+        inverters = [(costs[n], n) for n, c in cells.items() if len(c.input_pins) == 1 and c.truth_table() == 0b01]
+        self.inverter = min(inverters) if inverters else None
+        self.matches = {}
+        # Cells of each NPN class by (arity, canonical table)
+        self.classes = {}
+        for cell_name, cell in cells.items():
+            arity = len(cell.input_pins)
+            transforms = list(npn_transforms(cell.truth_table(), arity))
+            canonical = min(t for t, *_ in transforms)
+            self.classes.setdefault((arity, canonical), []).append(cell_name)
+            for table, pins, negated, inverted in transforms:
+                inverters = bin(negated).count("1") + inverted
+                if inverters and self.inverter is None:
+                    continue
+                cost = costs[cell_name] + (inverters * self.inverter[0] if inverters else 0)
+                key = (arity, table)
+                if key not in self.matches or cost < self.matches[key][0]:
+                    self.matches[key] = (cost, cell_name, pins, negated, inverted)
+
+    def lookup(self, arity, table):
+        """
+        Returns:
+            tuple: (cost, cell name, pins, negated, inverted) where input pins[i] drives pin i
+                   of the cell, through an inverter if bit i of negated is set, and the output
+                   of the cell goes through an inverter if inverted. Costs include the inverters.
+                   None if no cell computes the function.
+        """
+        return self.matches.get((arity, table))
+
+    def npn_class(self, arity, table):
+        """
+        Returns:
+            list: Names of the cells computing the function up to NPN equivalence
+        """
+        return self.classes.get((arity, npn_canonical(table, arity)), [])
+
 class TinyLib:
     def __init__(self, lib_file="dbfiles/stdcells.lib"):
         vprint_title(f"Loading library", v=INFO)
         self.cells = {}
         self.cell_costs = {}
         self.libname = None
+        # Lets worker processes load the same library
+        self.lib_file = os.path.abspath(lib_file)
         try:
             with open(lib_file, 'r') as file:
                 data = json.load(file)
                 self.cells = {}
                 self.libname = data["library"]["name"]
+                # Identifies the cells, costs and patterns, mapping results are only valid for the same fingerprint
+                self.fingerprint = hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
                 for key, value in data["cells"].items():
                     cell = NodeFactory(key, value["pins"], value["patterns"])
                     self.cells[key] = cell
                     self.cell_costs[key] = value["cost"]
-                    globals()[key] = cell
+                # Only for scripts importing the cells by name, cells pickle through cell_table
+                globals().update(self.cells)
+                self.pattern_index = PatternIndex(self.cells)
+                self.function_index = FunctionIndex(self.cells, self.cell_costs)
                 vprint(f"Loaded library {self.libname} with {len(self.cells)} cells", v=INFO)
                 vprint(f"Loaded cells: {', '.join(self.cells.keys())}", v=VERBOSE)
         except (KeyError, json.JSONDecodeError) as e:
@@ -0,0 +1,220 @@
+"""
+Iterative traversals over Node trees and TinyDB DAGs.
+All traversals use explicit stacks, so the depth of a tree is never limited by
+the Python recursion limit.
+
+Tree traversals (post_order, pre_order, fold) visit a node once per occurrence,
+exactly like walking the tree recursively. DAG traversals (topological, levelized)
+visit every node once and follow leaf strings that name variables of a database.
+"""
+from numbers import Number
+from utils.PrettyStream import err_msg
+
+def is_node(item):
+    """
+    Whether item is a node rather than a leaf. Nodes are recognized by their children,
+    so this module does not depend on the Node class.
+    """
+    return hasattr(item, "children")
+
+def resolve(leaf, db=None):
+    """
+    Follow a leaf string naming a variable of db to its tree, through variables
+    assigned another signal or a constant
+    """
+    if not isinstance(leaf, str) or db is None:
+        return leaf
+    seen = None
+    while True:
+        tree = db.vars.get(leaf)
+        if is_node(tree):
+            return tree
+        if tree is None or tree == leaf:
+            return leaf
+        if not isinstance(tree, str):
+            return tree
+        # Variables assigned to each other in a cycle drive nothing, stop at the cycle
+        seen = {leaf} if seen is None else seen
+        if tree in seen:
+            return leaf
+        seen.add(tree)
+        leaf = tree
+
+def post_order(root):
+    """
+    Yield every child (leaf or node) before its parent
+    """
+    stack = [(root, False)]
+    while stack:
+        item, expanded = stack.pop()
+        if expanded or not is_node(item):
+            yield item
+            continue
+        stack.append((item, True))
+        for c in reversed(item.children):
+            stack.append((c, False))
+
+def pre_order(root, depth=False):
+    """
+    Yield every parent before its children, optionally as (item, depth) pairs
+    """
+    stack = [(root, 0)]
+    while stack:
+        item, d = stack.pop()
+        yield (item, d) if depth else item
+        if is_node(item):
+            for c in reversed(item.children):
+                stack.append((c, d + 1))
+
+def fold(root, fn, leaf_fn=None, stop=None):
+    """
+    Bottom-up evaluation of a tree without recursion.
+
+    Args:
+        fn: Called as fn(node, child_values) for every node
+        leaf_fn: Called as leaf_fn(leaf) for every leaf, leaves are passed through if None
+        stop: Nodes for which stop(node) is true are treated as leaves
+    Returns:
+        The value of fn at the root
+    """
+    if not is_node(root):
+        return root if leaf_fn is None else leaf_fn(root)
+    values = []
+    stack = [(root, False)]
+    while stack:
+        item, expanded = stack.pop()
+        if not is_node(item) or (not expanded and stop is not None and stop(item)):
+            values.append(item if leaf_fn is None else leaf_fn(item))
+        elif expanded:
+            n = len(item.children)
+            children = values[len(values) - n:]
+            del values[len(values) - n:]
+            values.append(fn(item, children))
+        else:
+            stack.append((item, True))
+            for c in reversed(item.children):
+                stack.append((c, False))
+    return values[0]
+
+def topological(roots, db=None, skip=()):
+    """
+    Every node reachable from roots exactly once, fanins before fanouts.
+    Leaf strings naming variables of db are followed into their trees.
+
+    Args:
+        roots (iterable): Nodes or leaves to start from
+        skip (container): Leaf strings that are not followed even if they name a variable
+    Returns:
+        list: Nodes in topological order
+    """
+    order = []
+    done = set()
+    visiting = set()
+    for root in roots:
+        root = resolve(root, db)
+        if not is_node(root) or id(root) in done:
+            continue
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                visiting.discard(id(node))
+                if id(node) not in done:
+                    done.add(id(node))
+                    order.append(node)
+                continue
+            if id(node) in done:
+                continue
+            if id(node) in visiting:
+                raise ValueError(f"Combinational loop through {node.output_signal}")
+            visiting.add(id(node))
+            stack.append((node, True))
+            for c in reversed(node.children):
+                if c in skip:
+                    continue
+                c = resolve(c, db)
+                if is_node(c) and id(c) not in done:
+                    stack.append((c, False))
+    return order
+
+def levelized(roots, db=None):
+    """
+    Group the nodes reachable from roots into levels: a node's level is one more than
+    the highest level among its fanins, and nodes driven only by leaves are at level 0.
+
+    Returns:
+        list: One list of nodes per level
+    """
+    level = {}
+    levels = []
+    for node in topological(roots, db):
+        l = 0
+        for c in node.children:
+            c = resolve(c, db)
+            if is_node(c):
+                l = max(l, level[id(c)] + 1)
+        level[id(node)] = l
+        if l == len(levels):
+            levels.append([])
+        levels[l].append(node)
+    return levels
+
+def evaluate(roots, env, db=None, values=None):
+    """
+    Evaluate every node reachable from roots in one topological pass.
+    Leaf strings in env take their value from env, even if they name a variable of db,
+    and env also overrides the output signal of internal nodes.
+
+    Args:
+        roots (list): Nodes to evaluate
+        env (dict): Mapping from signal name to value
+        values (dict): Value cache keyed by id of the node, nodes already in it are not evaluated again
+    Returns:
+        dict: The value cache, holding the value of every evaluated node
+    """
+    values = {} if values is None else values
+    def value(child):
+        if is_node(child):
+            return values[id(child)]
+        elif isinstance(child, Number):
+            return child
+        elif child in env:
+            return env[child]
+        tree = resolve(child, db)
+        if is_node(tree):
+            return values[id(tree)]
+        if isinstance(tree, Number):
+            return tree
+        if tree in env:
+            return env[tree]
+        err_msg(f"Insufficient env: variable {child} undefined")
+        raise ValueError(child)
+    pending = [r for r in roots if is_node(r) and id(r) not in values]
+    root_ids = {id(r) for r in pending}
+    for node in topological(pending, db, skip=env):
+        if id(node) in values:
+            continue
+        if id(node) not in root_ids and node.output_signal in env:
+            values[id(node)] = env[node.output_signal]
+        else:
+            values[id(node)] = type(node).output_func(*[value(c) for c in node.children])
+    return values
+
+def leaf_value(leaf, env, db=None, values=None):
+    """
+    Value of a tree or leaf: a constant, a signal of env, or a tree (possibly named
+    by a variable of db) evaluated into values
+    """
+    if isinstance(leaf, Number):
+        return leaf
+    if not is_node(leaf) and leaf in env:
+        return env[leaf]
+    tree = resolve(leaf, db)
+    if is_node(tree):
+        return evaluate([tree], env, db, values)[id(tree)]
+    if isinstance(tree, Number):
+        return tree
+    if tree in env:
+        return env[tree]
+    err_msg(f"Insufficient env: variable {leaf} undefined")
+    raise ValueError(leaf)
@@ -0,0 +1,179 @@
+from numbers import Number
+from utils.PrettyStream import *
+from db.TinyDB import TinyDB
+from db.Node import Node
+from db.LogicNodes import INV
+
+def cleanup_pass(db: TinyDB):
+    """
+    Logic cleanup pass for the TinyDB, in a single topological sweep over all nodes:
+    - constants are folded and repeated operands of a gate are merged
+    - double inverters cancel out
+    - structurally identical gates are merged across all variables
+    - logic that does not reach an output is dropped
+
+    Merged gates that end up with more than one fanout become variables,
+    so the trees of the result never share nodes.
+    """
+    vprint_title("Cleanup Pass", v=INFO)
+    original_db = db
+    before = len(original_db.topological_order())
+
+    roots = {id(tree): name for name, tree in original_db.vars.items() if isinstance(tree, Node)}
+    # Simplified value of each variable: a Node, the name of another signal or a constant
+    values = {}
+    for name, tree in original_db.vars.items():
+        if isinstance(tree, Number):
+            values[name] = int(bool(tree))
+        elif isinstance(tree, str):
+            values[name] = tree
+    owner = {}
+    strash = {}
+    replaced = {}
+
+    def ref(leaf):
+        """
+        Follow a leaf through variables that simplified to constants or other signals
+        """
+        if isinstance(leaf, Number):
+            return int(bool(leaf))
+        seen = set()
+        while leaf in values and leaf not in seen:
+            value = values[leaf]
+            if isinstance(value, Node):
+                break
+            seen.add(leaf)
+            leaf = value
+            if isinstance(leaf, int):
+                break
+        return leaf
+
+    def make(cls, children, signal):
+        """
+        Return the simplified, structurally hashed equivalent of cls(*children)
+        """
+        if cls is INV and type(children[0]) is INV:
+            return children[0].children[0]
+        keys = [key(c) for c in children]
+        operands = {k: c for k, c in zip(keys, children) if not isinstance(c, int)}
+        if len(operands) < len(children) and len(operands) <= 1:
+            # Restrict the truth table to the remaining operand
+            table = cls.truth_table()
+            names = list(operands)
+            reduced = 0
+            for j in range(1 << len(names)):
+                index = 0
+                for i, (k, c) in enumerate(zip(keys, children)):
+                    bit = c if isinstance(c, int) else j
+                    index |= (bit & 1) << i
+                reduced |= ((table >> index) & 1) << j
+            if not names or reduced in (0b00, 0b11):
+                return reduced & 1
+            operand = operands[names[0]]
+            return operand if reduced == 0b10 else make(INV, [operand], signal)
+        table = cls.truth_table()
+        if len(keys) == 2 and (table >> 1) & 1 == (table >> 2) & 1:
+            keys.sort(key=lambda k: (type(k).__name__, k))
+        hash_key = (cls, tuple(keys))
+        node = strash.get(hash_key)
+        if node is None:
+            node = cls(*children, out=signal)
+            strash[hash_key] = node
+        return node
+
+    def key(c):
+        if isinstance(c, Node):
+            return id(c)
+        if isinstance(c, int):
+            return ("const", c)
+        return c
+
+    for node in original_db.topological_order():
+        children = [replaced[id(c)] if isinstance(c, Node) else ref(c) for c in node.children]
+        name = roots.get(id(node))
+        result = make(type(node), children, node.output_signal if name is None else name)
+        replaced[id(node)] = result
+        if name is None:
+            continue
+        if not isinstance(result, Node):
+            values[name] = result
+        elif id(result) not in owner:
+            owner[id(result)] = name
+            result.output_signal = name
+            values[name] = result
+        elif name in original_db.outputs:
+            # Outputs need their own driver
+            result = type(result)(*result.children, out=name)
+            owner[id(result)] = name
+            values[name] = result
+        else:
+            values[name] = owner[id(result)]
+
+    def final(name):
+        tree = original_db.vars.get(name)
+        if not isinstance(tree, Node):
+            return None if tree is None else ref(tree)
+        value = values[name]
+        if name in original_db.outputs and not isinstance(value, Node):
+            # Keep a driver for outputs tied to an input or a constant
+            return INV(INV(value), out=name)
+        return value
+
+    # Collect the logic reaching the outputs and count the fanouts of every gate
+    kept = {}
+    fanouts = {}
+    seen = set()
+    stack = sorted(original_db.outputs)
+    while stack:
+        name = stack.pop()
+        if name in kept or original_db.vars.get(name) is None:
+            continue
+        kept[name] = final(name)
+        nodes = [kept[name]] if isinstance(kept[name], Node) else []
+        if isinstance(kept[name], str):
+            stack.append(kept[name])
+        while nodes:
+            node = nodes.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            for c in node.children:
+                if isinstance(c, Node) and id(c) in owner:
+                    stack.append(owner[id(c)])
+                elif isinstance(c, Node):
+                    fanouts[id(c)] = fanouts.get(id(c), 0) + 1
+                    nodes.append(c)
+                elif isinstance(c, str):
+                    stack.append(c)
+
+    # Refer to variable roots and shared gates by name
+    shared = {}
+    for tree in list(kept.values()):
+        if not isinstance(tree, Node):
+            continue
+        nodes = [tree]
+        while nodes:
+            node = nodes.pop()
+            children = []
+            for c in node.children:
+                if isinstance(c, Node) and (id(c) in owner or fanouts[id(c)] > 1):
+                    if id(c) not in owner:
+                        owner[id(c)] = f"{c.output_signal}_var"
+                        shared[owner[id(c)]] = c
+                        nodes.append(c)
+                    children.append(owner[id(c)])
+                else:
+                    if isinstance(c, Node):
+                        nodes.append(c)
+                    children.append(c)
+            node.children = children
+    kept.update(shared)
+
+    db = original_db.make_empty_copy()
+    for name, tree in kept.items():
+        db.add_var(name, tree)
+
+    vprint(f"Cleaned up {before} gates into {len(db.topological_order())}", v=INFO)
+    vprint("Cleaned:", db, v=INFO)
+    vprint_pretty(db, v=VERBOSE)
+    return db
@@ -0,0 +1,327 @@
+import math
+from itertools import product
+from numbers import Number
+from utils.PrettyStream import *
+from db.TinyDB import TinyDB
+from db.TinyLib import TinyLib
+from db.Node import Node
+from db.Traversal import resolve
+from db.Patterns import exhaustive_word
+from db.Simulator import eval_table
+
+# Cuts kept per node, for each of implementable and not (yet) implementable cuts
+CUT_LIMIT = 8
+
+class Cut:
+    """
+    A k-feasible cut of a node: a set of signals such that every path from the inputs to
+    the node passes through one of them. Leaves are signal indices in increasing order and
+    bit j of the truth table is the value of the node when leaf i is set to bit i of j.
+    """
+    __slots__ = ["leaves", "table", "match", "area"]
+
+    def __init__(self, leaves, table):
+        self.leaves = leaves
+        self.table = table
+        # (cost, cell name, pins, negated, inverted) of the cheapest cell computing the cut, if any
+        self.match = None
+        self.area = math.inf
+
+    def __repr__(self):
+        return f"Cut({self.leaves}, {self.table:#x}, {self.match}, {self.area})"
+
+def cut_mapping_pass(db: TinyDB, lib: TinyLib, k=None, cut_limit=CUT_LIMIT, recovery=1):
+    """
+    Cut-based technology mapping pass for the TinyDB.
+    The whole DAG is mapped at once instead of tree by tree:
+    - priority cuts of up to k leaves are enumerated bottom-up in one topological sweep,
+      along with the truth table of each cut
+    - cuts are matched to cells up to NPN equivalence through the Boolean matching index
+      of the library, with inverters on the cell inputs and output where needed
+    - each node picks the cut of least area flow, then rounds of exact area recovery
+      reselect the cuts of the nodes in the cover
+    Nodes with more than one fanout in the cover become variables, so no logic is duplicated.
+    Nodes computing a constant are folded into their fanouts and the outputs they drive.
+
+    Args:
+        k (int): Largest number of cut leaves, the largest cell arity of lib if None
+        cut_limit (int): Cuts kept per node
+        recovery (int): Rounds of exact area recovery
+    """
+    vprint_title("Cut Mapping Pass", v=INFO)
+    vprint(f"Mapping {db.name} to technology library {lib.libname}", v=INFO)
+    k = max(len(cell.input_pins) for cell in lib.cells.values()) if k is None else k
+    order = db.topological_order()
+    index = {id(node): i for i, node in enumerate(order)}
+    inputs = {}
+
+    def signal(leaf):
+        """
+        Signal index of a child, or None for constants
+        """
+        leaf = resolve(leaf, db)
+        if isinstance(leaf, Node):
+            return index[id(leaf)]
+        if isinstance(leaf, Number):
+            return None
+        if leaf not in inputs:
+            inputs[leaf] = len(order) + len(inputs)
+        return inputs[leaf]
+
+    fanins = [[signal(c) for c in node.children] for node in order]
+    # Value of each constant fanin, None for signals
+    values = [[int(bool(resolve(c, db))) if s is None else None for s, c in zip(fanin, node.children)]
+              for fanin, node in zip(fanins, order)]
+    # Node driving each output driven by logic, and the output named after each such node,
+    # preferring the output the node is the root of
+    drivers = {}
+    for name in db.outputs:
+        s = signal(db.vars[name]) if db.vars.get(name) is not None else None
+        if s is not None and s < len(order):
+            drivers[name] = s
+    outputs = {}
+    for name, s in sorted(drivers.items(), key=lambda item: (not isinstance(db.vars[item[0]], Node), item[0])):
+        outputs.setdefault(s, name)
+
+    # Estimated fanout of every node in the subject graph, for area flow
+    fanouts = [0] * len(order)
+    for fanin in fanins:
+        for s in fanin:
+            if s is not None and s < len(order):
+                fanouts[s] += 1
+    for s in outputs:
+        fanouts[s] += 1
+
+    best = [None] * len(order)
+    # Value of each node computing a constant
+    constants = {}
+    for i, node in enumerate(order):
+        for p, s in enumerate(fanins[i]):
+            if s in constants:
+                fanins[i][p] = None
+                values[i][p] = constants[s]
+        node.cuts = enumerate_cuts(node, fanins[i], values[i], order, best, fanouts, lib, k, cut_limit)
+        constant = next((c.table & 1 for c in node.cuts if c.table in (0, (1 << (1 << len(c.leaves))) - 1)), None)
+        if constant is not None:
+            # Constant cones are folded into their fanouts and the outputs they drive
+            constants[i] = constant
+            node.cuts = []
+            continue
+        matched = [cut for cut in node.cuts if cut.match is not None]
+        best[i] = matched[0] if matched else None
+
+    tied = {}
+    for name, s in list(drivers.items()):
+        if s in constants:
+            tied[name] = constants[s]
+            del drivers[name]
+    outputs = {s: name for s, name in outputs.items() if s not in constants}
+
+    refs = reference(best, outputs)
+    for i, n in enumerate(refs):
+        if n and best[i] is None:
+            raise ValueError(f"No cell of {lib.libname} implements the logic driving {outputs.get(i, order[i].output_signal)}")
+    vprint(f"Area flow cover: {cover_area(best, refs):g}", v=VERBOSE)
+    for _ in range(recovery):
+        recover_area(order, best, refs)
+        vprint(f"Area after recovery: {cover_area(best, refs):g}", v=VERBOSE)
+
+    mapped = build_netlist(db, order, inputs, drivers, tied, best, refs, outputs, lib)
+    vprint("Mapped", mapped, v=INFO)
+    vprint_pretty(mapped, v=VERBOSE)
+    return mapped
+
+def enumerate_cuts(node, fanin, values, order, best, fanouts, lib, k, cut_limit):
+    """
+    Merge the cuts of the fanins of a node into the priority cuts of the node.
+    Cuts no cell implements are kept apart, they may still grow into implementable
+    cuts of the fanouts.
+
+    Args:
+        fanin (list): Signal of each fanin, None for constants
+        values (list): Value of each constant fanin
+    """
+    options = []
+    for s in fanin:
+        if s is None:
+            options.append([None])
+        elif s < len(order):
+            options.append([Cut((s,), 0b10)] + order[s].cuts)
+        else:
+            options.append([Cut((s,), 0b10)])
+    table = type(node).truth_table()
+    cuts = {}
+    for combination in product(*options):
+        leaves = set()
+        for cut in combination:
+            if cut is not None:
+                leaves.update(cut.leaves)
+        if len(leaves) > k:
+            continue
+        leaves = tuple(sorted(leaves))
+        if leaves in cuts:
+            continue
+        width = 1 << len(leaves)
+        mask = (1 << width) - 1
+        words = {leaf: exhaustive_word(p, width) for p, leaf in enumerate(leaves)}
+        fanin_words = []
+        for value, cut in zip(values, combination):
+            if cut is None:
+                fanin_words.append(mask if value else 0)
+            else:
+                fanin_words.append(eval_table(cut.table, mask, *[words[leaf] for leaf in cut.leaves]))
+        cut = Cut(leaves, eval_table(table, mask, *fanin_words))
+        cut.match = lib.function_index.lookup(len(leaves), cut.table)
+        cut.area = area_flow(cut, best, fanouts)
+        cuts[leaves] = cut
+    matched = sorted((c for c in cuts.values() if c.match is not None), key=lambda c: (c.area, len(c.leaves)))
+    unmatched = sorted((c for c in cuts.values() if c.match is None), key=lambda c: (len(c.leaves), c.area))
+    return matched[:cut_limit] + unmatched[:cut_limit]
+
+def area_flow(cut, best, fanouts):
+    """
+    Area of the cell of the cut plus the area flowing in from its leaves, where the area
+    of a node is shared among its fanouts. Without a cell only the leaves are counted.
+    """
+    flow = cut.match[0] if cut.match is not None else 0
+    for leaf in cut.leaves:
+        if leaf < len(best):
+            flow += (best[leaf].area if best[leaf] is not None else math.inf) / max(1, fanouts[leaf])
+    return flow
+
+def reference(best, outputs):
+    """
+    Count the references to every node in the cover reached from the outputs
+    """
+    refs = [0] * len(best)
+    for s in outputs:
+        refs[s] += 1
+        if refs[s] == 1:
+            ref_cut(best[s], best, refs)
+    return refs
+
+def ref_cut(cut, best, refs):
+    """
+    Add the cut to the cover, along with the cuts of the nodes it newly references
+
+    Returns:
+        float: Area added to the cover, infinite if a new node has no cell
+    """
+    area = 0
+    stack = [cut]
+    while stack:
+        cut = stack.pop()
+        area += cut.match[0]
+        for leaf in cut.leaves:
+            if leaf < len(best):
+                refs[leaf] += 1
+                if refs[leaf] == 1:
+                    if best[leaf] is None:
+                        area = math.inf
+                    else:
+                        stack.append(best[leaf])
+    return area
+
+def deref_cut(cut, best, refs):
+    """
+    Remove the cut from the cover, along with the cuts of the nodes no longer referenced
+
+    Returns:
+        float: Area removed from the cover
+    """
+    area = 0
+    stack = [cut]
+    while stack:
+        cut = stack.pop()
+        area += cut.match[0]
+        for leaf in cut.leaves:
+            if leaf < len(best):
+                refs[leaf] -= 1
+                if refs[leaf] == 0 and best[leaf] is not None:
+                    stack.append(best[leaf])
+    return area
+
+def cover_area(best, refs):
+    return sum(best[i].match[0] for i in range(len(best)) if refs[i] > 0)
+
+def recover_area(order, best, refs):
+    """
+    Exact area recovery: every node in the cover takes the cut that adds the least
+    area given the rest of the cover
+    """
+    for i, node in enumerate(order):
+        if refs[i] == 0:
+            continue
+        deref_cut(best[i], best, refs)
+        chosen, chosen_area = best[i], math.inf
+        for cut in node.cuts:
+            if cut.match is None:
+                continue
+            area = ref_cut(cut, best, refs)
+            deref_cut(cut, best, refs)
+            if area < chosen_area:
+                chosen, chosen_area = cut, area
+        ref_cut(chosen, best, refs)
+        best[i] = chosen
+
+def build_netlist(db, order, inputs, drivers, tied, best, refs, outputs, lib):
+    """
+    Instantiate the cells of the cover. Nodes driving an output or more than one cell
+    become variables, all other cells are nested into the tree of their only fanout.
+
+    Args:
+        drivers (dict): Node driving each output driven by logic
+        tied (dict): Value of each output driven by a constant cone
+    """
+    mapped = db.make_empty_copy()
+    input_names = {s: name for name, s in inputs.items()}
+    roots = {id(tree): name for name, tree in db.vars.items() if isinstance(tree, Node)}
+    var_names = {}
+    for i, node in enumerate(order):
+        if i in outputs:
+            var_names[i] = outputs[i]
+        elif refs[i] > 1:
+            var_names[i] = roots.get(id(node), f"{node.output_signal}_var")
+
+    def invert(child, out=None):
+        cell = lib.cells[lib.function_index.inverter[1]](child, out=out)
+        cell.state = Node.State.POST_SYNTH
+        return cell
+
+    def leaf(s):
+        if s >= len(order):
+            return input_names[s]
+        return var_names[s] if s in var_names else built[s]
+
+    built = {}
+    for i, node in enumerate(order):
+        if refs[i] == 0:
+            continue
+        _, cell_name, pins, negated, inverted = best[i].match
+        args = [leaf(best[i].leaves[p]) for p in pins]
+        args = [invert(a) if (negated >> pin) & 1 else a for pin, a in enumerate(args)]
+        out = var_names.get(i, node.output_signal)
+        if inverted:
+            cell = invert(lib.cells[cell_name](*args), out)
+        else:
+            cell = lib.cells[cell_name](*args, out=out)
+        cell.state = Node.State.POST_SYNTH
+        built[i] = cell
+        if i in var_names:
+            mapped.add_var(var_names[i], cell)
+
+    # Outputs without logic of their own still get cells, so the netlist drives them:
+    # aliases of another output or of an input are buffered with a double inversion,
+    # as in NandGraph.to_db, and constants are tied by an inverter of the complement
+    for name in sorted(db.outputs):
+        if mapped.vars.get(name) is not None or db.vars.get(name) is None:
+            continue
+        if name in drivers:
+            leaf = var_names[drivers[name]]
+        else:
+            leaf = tied.get(name, resolve(db.vars[name], db))
+        if isinstance(leaf, Number):
+            mapped.add_var(name, invert(int(not leaf), name))
+        else:
+            mapped.add_var(name, invert(invert(leaf), name))
+    return mapped
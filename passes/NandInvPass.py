@@ -2,35 +2,53 @@ from utils.PrettyStream import *
 from db.TinyDB import TinyDB
 from db.Node import Node
 from db.LogicNodes import *
+from db.NandGraph import NandGraph
+from db.Traversal import fold
 
 def nand_inv_pass(db: TinyDB, duplicate=False):
     """
     NAND INV conversion pass for the TinyDB
+
+    Args:
+        duplicate (bool): Convert every variable into a standalone tree, copying shared operands.
+                          Otherwise the logic is built in a structurally hashed NandGraph, where
+                          shared logic exists once and becomes a variable, so the result stays
+                          linear in the size of the input.
     """
     vprint_title("NAND INV Conversion Pass", v=INFO)
     original_db = db
-    # db has inputs and outputs but no insides
-    db = original_db.make_empty_copy()
-    new_vars={}
-    for name, tree in original_db.vars.items():
-        vprint(f"Converting pin {name}", v=VERBOSE)
-        if isinstance(tree, Node):
-            tree = convert_node(tree,new_vars, duplicate=duplicate, out=name)
-        db.add_var(name, tree)
-    
-    for name, tree in new_vars.items():
-        db.add_var(name, tree)
+    if duplicate:
+        # db has inputs and outputs but no insides
+        db = original_db.make_empty_copy()
+        for name, tree in original_db.vars.items():
+            vprint(f"Converting pin {name}", v=VERBOSE)
+            if isinstance(tree, Node):
+                tree = convert_node(tree, duplicate=True, out=name)
+            db.add_var(name, tree)
+    else:
+        db = NandGraph.from_db(original_db).to_db(original_db.name)
+        for name in original_db.inputs - db.inputs:
+            db.add_input(name)
+        for name in original_db.outputs - db.outputs:
+            db.add_output(name)
 
     vprint("Converted:", db,v=INFO)
     vprint_pretty(db,v=VERBOSE)
     return db
 
-def convert_node(node: Node, new_vars={}, duplicate=True, out=None):
+def convert_node(node: Node, new_vars=None, duplicate=True, out=None):
+    """
+    NAND INV conversion pass for a single node.
+    Without duplicate, operands of XORs become variables collected in new_vars.
+    """
+    new_vars = {} if new_vars is None else new_vars
+    vprint(f"Converting node {node.cell_name}|{node.output_signal}", v=DEBUG)
+    return fold(node, lambda n, children: convert_gate(n, children, new_vars, duplicate, out if n is node else n.output_signal))
+
+def convert_gate(node: Node, children, new_vars, duplicate, out):
     """
-    NAND INV conversion pass for a single node
+    NAND INV conversion of a single gate whose children are already converted
     """
-    vprint(f"Converting node {node}", v=DEBUG)
-    children = [ convert_node(c,new_vars,duplicate,out=c.output_signal) if isinstance(c, Node) else c for c in node.children ]
     a = children[0]
     b = children[1] if len(children) > 1 else None
     match node:
@@ -44,7 +62,7 @@ def convert_node(node: Node, new_vars={}, duplicate=True, out=None):
             return NAND(INV(a), INV(b),out=out)
         case NOR():
             return INV(NAND(INV(a), INV(b)), out=out)
-        case XOR():
+        case XOR() | XNOR():
             if not duplicate:
                 if isinstance(a,Node):
                     var_name = a.output_signal+"_var"
@@ -56,7 +74,7 @@ def convert_node(node: Node, new_vars={}, duplicate=True, out=None):
                     b.output_signal = var_name
                     new_vars[var_name]=b
                     b = var_name
-                return NAND(NAND(a, INV(b)), NAND(INV(a), b), out=out)
+                a_copy, b_copy = a, b
             else:
                 a_copy = a
                 if isinstance(a,Node):
@@ -64,7 +82,9 @@ def convert_node(node: Node, new_vars={}, duplicate=True, out=None):
                 b_copy = b
                 if isinstance(b,Node):
                     b_copy = b.copy(True)
-                return NAND(NAND(a, INV(b)), NAND(INV(a_copy), b_copy), out=out)
+            if isinstance(node, XNOR):
+                return NAND(NAND(a, b), NAND(INV(a_copy), INV(b_copy)), out=out)
+            return NAND(NAND(a, INV(b)), NAND(INV(a_copy), b_copy), out=out)
         case _:
             err_msg(f"Unknown node type: {node}")
             raise ValueError(f"Unknown node type: {node}")
\ No newline at end of file
@@ -1,110 +1,257 @@
-from lark import Lark, Tree, Token
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from lark import Lark, Token, Transformer
 from utils.PrettyStream import *
 from db.TinyDB import TinyDB
 from db.LogicNodes import *
 
-sv = True
+# Compiled parsers by grammar file, reused while the grammar text is unchanged
+_parsers = {}
+_parsers_lock = threading.Lock()
+
+# Names Node.new_node gives to intermediate wires
+_WIRE_NAME = re.compile(r"\d+w")
+
+class ParseContext:
+    """
+    State of a single parse. Each invocation of parser_pass has its own context,
+    so parses running in different threads never share state.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.sv = filename.endswith(".sv")
+        self.grammar = "grammars/tinysv.lark" if self.sv else "grammars/tinyv.lark"
 
 def parser_pass(input_file):
     """
     Parse the input file and return the database
     """
-    global sv
-    sv = input_file.endswith(".sv")
+    ctx = ParseContext(input_file)
     vprint_title("Parser Pass")
-    ast = parse(input_file)
-    db = extract_db(ast)
+    db = None if ctx.sv else scan_netlist(input_file)
+    if db is None:
+        ast = parse(input_file, ctx)
+        db = extract_db(ast)
     vprint("Parsed:", db,v=INFO)
     vprint_pretty(db,v=VERBOSE)
     return db
 
-def parse(filename):
-    grammar = "grammars/tinysv.lark" if sv else "grammars/tinyv.lark"
+def get_parser(grammar_file):
+    """
+    Return the LALR parser of a grammar file, built once per process.
+    The parser builds the netlist while parsing through NetlistBuilder.
+    Lark also caches the parse tables on disk, keyed by a hash of the grammar,
+    so new processes load the tables instead of regenerating them.
+    """
+    with open(grammar_file) as f:
+        grammar = f.read()
+    key = hashlib.sha256(grammar.encode()).hexdigest()
+    with _parsers_lock:
+        cached = _parsers.get(grammar_file)
+        if cached is None or cached[0] != key:
+            vprint(f"Building parser for {grammar_file}", v=DEBUG)
+            parser = Lark(grammar, start="start", parser="lalr", transformer=NetlistBuilder(), cache=True)
+            cached = (key, parser)
+            _parsers[grammar_file] = cached
+    return cached[1]
+
+def parse(filename, ctx=None):
+    ctx = ParseContext(filename) if ctx is None else ctx
     with open(filename) as f:
         text = f.read()
-    with open(grammar) as f:
-        grammar = f.read()
-    parser = Lark(grammar, start="start", parser="lalr")
-    return parser.parse(text)
+    return get_parser(ctx.grammar).parse(text)
 
-def extract_db(ast_tree):
-    db = TinyDB("stub")
-    visit(ast_tree, db)
+def rename_wires(db):
+    """
+    Give fresh names to the intermediate wires of a database parsed in another
+    process, whose wire counter is independent of ours
+    """
+    for node in db.topological_order():
+        if _WIRE_NAME.fullmatch(node.output_signal):
+            node.output_signal = Node.new_node()
     return db
 
-def visit(ast_node, db):
-    if isinstance(ast_node, Tree):
-        match ast_node.data:
-            case "module":
-                db.name = ast_node.children[0]
-                for c in ast_node.children:
-                    visit(c,db)
-            case "port_decl_list":
-                for c in ast_node.children:
-                    visit(c, db)
-            case "port_decl":
-                if sv:
-                    match ast_node.children:
-                        case [Token("DIR","input"), Token("ID",id)]:
-                            db.add_input(id)
-                            vprint(f"Input port: {id}", v=VERBOSE)
-                        case [Token("DIR","output"), Token("ID",id)]:  
-                            db.add_output(id)
-                            vprint(f"Output port: {id}", v=VERBOSE)
-            case "assignment":
-                match ast_node.children:
-                    case [Token("ID",id), expr]:
-                        db.add_var(id, visit_expr(expr,out=id))
-            case "decl":
-                if sv:
-                    db.add_var(ast_node.children[0].value)
-                else:
-                    match ast_node.children:
-                        case [Token("TYPE","input"), Token("ID",id)]:
-                            db.add_input(id)
-                            vprint(f"Input port: {id}", v=VERBOSE)
-                        case [Token("TYPE","output"), Token("ID",id)]:  
-                            db.add_output(id)
-                            vprint(f"Output port: {id}", v=VERBOSE)
-                        case [Token("TYPE","wire"), Token("ID",id)]:
-                            db.add_var(id)
-            case _:
-                err_msg(f"Unknown AST node type: {ast_node.data}")
-                vprint(ast_node, v=DEBUG)
-    return
-
-def visit_expr(ast_node, out=None):
-    if isinstance(ast_node, Tree):
-        match ast_node.data:
-            case "bit_or":
-                return OR(visit_expr(ast_node.children[0]), visit_expr(ast_node.children[1]),out=out)
-            case "bit_and":
-                return AND(visit_expr(ast_node.children[0]), visit_expr(ast_node.children[1]),out=out)
-            case "bit_nand":
-                return NAND(visit_expr(ast_node.children[0]), visit_expr(ast_node.children[1]),out=out)
-            case "bit_nor":
-                return NOR(visit_expr(ast_node.children[0]), visit_expr(ast_node.children[1]),out=out)
-            case "bit_xnor":
-                return XNOR(visit_expr(ast_node.children[0]), visit_expr(ast_node.children[1]),out=out)
-            case "bit_xor":
-                return XOR(visit_expr(ast_node.children[0]), visit_expr(ast_node.children[1]),out=out)
-            case "bit_not":
-                return INV(visit_expr(ast_node.children[0]),out=out)
-            case _:
-                err_msg(f"Unknown expression type: {ast_node.data}")
-    elif isinstance(ast_node, Token):
-        match ast_node.type:
-            case "ID":
-                return ast_node.value
-            case "LITERAL":
-                match ast_node.value:
-                    case "0" | "1'b0":
-                        return 0
-                    case "1" | "1'b1":
-                        return 1
-                    case _:
-                        err_msg(f"Unknown literal value: {ast_node.value}")
-                return ast_node.value
+def parse_many(files, workers=None, processes=False):
+    """
+    Parse a list of .v/.sv files concurrently
+
+    Args:
+        files (list): Files to parse
+        workers (int): Number of workers, one per core if None
+        processes (bool): Use a process pool instead of a thread pool
+    Returns:
+        list: One TinyDB per file, in the order of files
+    """
+    workers = workers or os.cpu_count() or 1
+    if processes:
+        from db.Parallel import pool_context
+        with ProcessPoolExecutor(workers, mp_context=pool_context()) as pool:
+            return [rename_wires(db) for db in pool.map(parser_pass, files)]
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(parser_pass, files))
+
+# Line patterns of flattened yosys netlists, one statement per line
+_ID = r"(?!logic\b)[a-zA-Z_][a-zA-Z0-9_]*"
+_OPERAND = rf"{_ID}|1'b[01]|[01]"
+# Identifiers of the header are separated by commas, so a name is never split in two
+_MODULE_LINE = re.compile(rf"module\s+({_ID})\s*(?:\(\s*(?:{_ID}(?:\s*,\s*{_ID})*)?\s*\))?\s*;")
+_DECL_LINE = re.compile(rf"(wire|input|output)\s+({_ID})\s*;")
+_ASSIGN_LINE = re.compile(rf"assign\s+({_ID})\s*=\s*(?:(~)\s*({_OPERAND})|({_OPERAND})\s*(?:(~&|~\||~\^|&|\||\^)\s*({_OPERAND}))?)\s*;")
+_OPERATORS = {"&": AND, "|": OR, "^": XOR, "~&": NAND, "~|": NOR, "~^": XNOR, "^~": XNOR}
+
+def scan_operand(text):
+    match text:
+        case "0" | "1'b0":
+            return 0
+        case "1" | "1'b1":
+            return 1
+    return text
+
+def scan_netlist(filename):
+    """
+    Fast path for flattened netlists as written by yosys: one declaration or
+    assignment of a single gate per line. The file is streamed line by line straight
+    into a database without building a parse tree.
+
+    Returns:
+        TinyDB: The database, or None if the file uses anything beyond this form,
+                in which case it should go through the full parser
+    """
+    db = TinyDB("stub")
+    state = "header"
+    with open(filename) as f:
+        for line in f:
+            line = line.split("//", 1)[0].strip()
+            if not line:
+                continue
+            if state == "body":
+                match = _ASSIGN_LINE.fullmatch(line)
+                if match:
+                    out, inv, inv_operand, a, op, b = match.groups()
+                    if inv:
+                        expr = INV(scan_operand(inv_operand), out=out)
+                    elif op:
+                        expr = _OPERATORS[op](scan_operand(a), scan_operand(b), out=out)
+                    else:
+                        expr = scan_operand(a)
+                    db.add_var(out, expr)
+                    continue
+                match = _DECL_LINE.fullmatch(line)
+                if match:
+                    kind, id = match.groups()
+                    if kind == "input":
+                        db.add_input(id)
+                        vprint(f"Input port: {id}", v=VERBOSE)
+                    elif kind == "output":
+                        db.add_output(id)
+                        vprint(f"Output port: {id}", v=VERBOSE)
+                    else:
+                        db.add_var(id)
+                    continue
+                if line == "endmodule":
+                    state = "done"
+                    continue
+            elif state == "header":
+                match = _MODULE_LINE.fullmatch(line)
+                if match:
+                    db.name = match.group(1)
+                    state = "body"
+                    continue
+            vprint(f"Falling back to the full parser at: {line}", v=DEBUG)
+            return None
+    return db if state == "done" else None
+
+# Operators whose chains can be regrouped into balanced trees
+_ASSOCIATIVE = {"&", "|", "^", "~^", "^~"}
+
+def balanced(op, operands):
+    """
+    Build a balanced tree of an associative operator by pairing neighbours level by level
+    """
+    while len(operands) > 1:
+        paired = [op(operands[i], operands[i + 1]) for i in range(0, len(operands) - 1, 2)]
+        if len(operands) % 2:
+            paired.append(operands[-1])
+        operands = paired
+    return operands[0]
+
+class NetlistBuilder(Transformer):
+    """
+    Builds Node trees while the LALR parser reduces, so no parse tree is ever built.
+    The builder holds no state and is shared by all parses. Statements come back as
+    tuples in source order and extract_db replays them into a database.
+    """
+    def operand(self, item):
+        if isinstance(item, Token):
+            if item.type == "LITERAL":
+                return scan_operand(item.value)
+            return item.value
+        return item
+
+    def chain(self, children):
+        """
+        A chain of operators of the same precedence, evaluated left to right.
+        Runs of the same associative operator become one balanced tree.
+        """
+        result = self.operand(children[0])
+        run = [result]
+        run_op = None
+        for op, operand in zip(children[1::2], children[2::2]):
+            operand = self.operand(operand)
+            if op == run_op and op in _ASSOCIATIVE:
+                run.append(operand)
+                continue
+            if run_op is not None:
+                result = balanced(_OPERATORS[run_op], run)
+            run = [result, operand]
+            run_op = op
+        return balanced(_OPERATORS[run_op], run) if run_op is not None else result
+
+    or_expr = chain
+    xor_expr = chain
+    and_expr = chain
+
+    def bit_not(self, children):
+        return INV(self.operand(children[0]))
+
+    def assignment(self, children):
+        id, expr = children[0].value, self.operand(children[1])
+        if isinstance(expr, Node):
+            expr.output_signal = id
+        return [("assign", id, expr)]
+
+    def port_decl(self, children):
+        return [(children[0].value, children[-1].value)]
+
+    def decl(self, children):
+        kind = children[0].value if len(children) > 1 else "wire"
+        return [(kind, children[-1].value)]
+
+    def port_decl_list(self, children):
+        return [s for c in children if isinstance(c, list) for s in c]
+
+    def module(self, children):
+        return children[0].value, [s for c in children[1:] if isinstance(c, list) for s in c]
+
+def extract_db(module):
+    """
+    Replay the statements returned by the parser into a new database
+    """
+    name, statements = module
+    db = TinyDB(name)
+    for kind, id, *expr in statements:
+        match kind:
+            case "input":
+                db.add_input(id)
+                vprint(f"Input port: {id}", v=VERBOSE)
+            case "output":
+                db.add_output(id)
+                vprint(f"Output port: {id}", v=VERBOSE)
+            case "assign":
+                db.add_var(id, expr[0])
             case _:
-                err_msg(f"Unknown token type: {ast_node.type}")
-    return ast_node
\ No newline at end of file
+                db.add_var(id)
+    return db
@@ -6,64 +6,150 @@ from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import time
 from itertools import permutations
 import math
+import os
+from concurrent.futures import ProcessPoolExecutor
 from multiprocessing import reduction
 from utils.PrettyStream import *
 from db.TinyDB import TinyDB
 from db.TinyLib import TinyLib
 from db.Node import Node
+from db.Traversal import topological
+from db.MappingCache import MappingCache, structural_hash, pack_entries, unpack_entries
+from db.MappingLog import MappingLog, read_steps
+from db.Parallel import pool_context
 from db.LogicNodes import *
 
-# Global animation log
-tech_map_steps = []
-
-# Modified tech_map with animation hooks
-def tech_map(node, lib, top_node=True, out=None):
-    if node.optimal_match is not None:
-        return node.optimal_match
+# Covers shared by all mapping runs of this process
+mapping_cache = MappingCache()
+
+# Number of mapping tasks per worker, so large clusters do not leave workers idle
+TASKS_PER_WORKER = 4
+
+_worker_lib = None
+_worker_cache = None
+
+def tech_map(node, lib, top_node=True, out=None, cache=None, hashes=None, log=None):
+    """
+    Map the tree rooted at node to the cells of lib
+
+    Args:
+        out (str): Name of the output of the mapped tree
+        cache (MappingCache): Covers of earlier mappings, the process wide cache if None
+        hashes (dict): Structural hashes of subject nodes, shared within a mapping run
+        log (MappingLog): Records the match attempts, nothing is recorded if None
+    Returns:
+        tuple: (mapped tree, cost)
+    """
+    cache = mapping_cache if cache is None else cache
+    hashes = {} if hashes is None else hashes
+    covers = {}
+    # Cover bottom-up so find_cover never recurses
+    for n in topological([node]):
+        find_cover(n, lib, cache, hashes, covers, log)
+    template, cost = covers[id(node)]
+    if template is None:
+        return None, cost
+    return build_cover(template, node, lib, out), cost
+
+def find_cover(node, lib, cache, hashes, covers, log=None):
+    """
+    The minimum cost cover of the tree rooted at node, looked up by the structure
+    of the tree and the library, or computed and cached.
+    Covers found in a run are also kept in covers for the rest of the run, so once the
+    nodes are covered bottom-up a node never recurses, even after cache evictions.
+
+    Args:
+        covers (dict): (template, cost) of the subject nodes covered in this run, by node id
+    Returns:
+        tuple: (template, cost), template is None if no pattern matches
+    """
+    entry = covers.get(id(node))
+    if entry is not None:
+        return entry
+    key = (structural_hash(node, hashes), lib.fingerprint)
+    entry = cache.get(key)
+    if entry is not None:
+        covers[id(node)] = entry
+        return entry
 
     best_cost = math.inf
-    best_tree = None
-
-    for cell_name, cell in lib.cells.items():
-        for p in cell.patterns:
-            cost = lib.cell_costs[cell_name]
-            result = match_pattern(node, p)
-            step = {
-                'node': node,
-                'cell': cell_name,
-                'pattern': p,
-                'matched': False,
-                'children': node.children
-            }
-
-            if result is None:
-                tech_map_steps.append(step)
-                continue
+    best_template = None
+
+    # Only patterns whose root and gate children fit the node are tried
+    for cell_name, p in lib.pattern_index.candidates(node):
+        cell = lib.cells[cell_name]
+        cost = lib.cell_costs[cell_name]
+        result = match_pattern(node, p)
+        if result is None:
+            if log is not None:
+                log.record(node, cell_name, p)
+            continue
 
-            match_cost = cost
-            subtrees = {}
-            for port, wire in result.items():
-                if isinstance(wire, Node):
-                    m, c = tech_map(wire, lib, top_node=False, out=wire.output_signal)
-                    match_cost += c
-                    subtrees[port] = m
-                else:
-                    subtrees[port] = wire
-
-            tree = cell(*[subtrees[pin] for pin in cell.input_pins], out=out)
-            step.update({
-                'matched': True,
-                'tree': tree,
-                'cost': match_cost
-            })
-            tech_map_steps.append(step)
-
-            if match_cost < best_cost:
-                best_tree = tree
-                best_cost = match_cost
-
-    node.optimal_match = best_tree, best_cost
-    return best_tree, best_cost
+        match_cost = cost
+        children = []
+        for pin in cell.input_pins:
+            wire = result[pin]
+            if isinstance(wire, Node):
+                sub, c = find_cover(wire, lib, cache, hashes, covers, log)
+                match_cost += c
+                children.append(("cover", find_path(node, wire), sub))
+            else:
+                children.append(("leaf", wire))
+
+        template = (cell_name, tuple(children))
+        if log is not None:
+            log.record(node, cell_name, p, template, match_cost)
+
+        if match_cost < best_cost:
+            best_template = template
+            best_cost = match_cost
+
+    if best_template is not None:
+        cache.put(key, (best_template, best_cost))
+    covers[id(node)] = (best_template, best_cost)
+    return best_template, best_cost
+
+def find_path(root, target):
+    """
+    The child indices leading from root to target, searched breadth first
+    since matched nodes sit close to the root
+    """
+    level = [((), root)]
+    while level:
+        deeper = []
+        for path, node in level:
+            for i, c in enumerate(node.children):
+                if c is target:
+                    return path + (i,)
+                if isinstance(c, Node):
+                    deeper.append((path + (i,), c))
+        level = deeper
+    raise ValueError(f"{target} is not in the tree of {root.output_signal}")
+
+def build_cover(template, node, lib, out=None):
+    """
+    Build the mapped tree of a cover template on the subject tree rooted at node.
+    Each cell takes the name of the subject node it covers, the root takes out.
+    """
+    built = []
+    stack = [(template, node, out, False)]
+    while stack:
+        (cell_name, children), subject, name, expanded = stack.pop()
+        if not expanded:
+            stack.append(((cell_name, children), subject, name, True))
+            for child in reversed(children):
+                if child[0] == "cover":
+                    target = subject
+                    for i in child[1]:
+                        target = target.children[i]
+                    stack.append((child[2], target, target.output_signal, False))
+            continue
+        n = sum(1 for child in children if child[0] == "cover")
+        subtrees = iter(built[len(built) - n:])
+        del built[len(built) - n:]
+        pins = [next(subtrees) if child[0] == "cover" else child[1] for child in children]
+        built.append(lib.cells[cell_name](*pins, out=name))
+    return built[0]
 
 # GUI to animate mapping steps
 class MappingAnimator(tk.Tk):
@@ -96,16 +182,19 @@ class MappingAnimator(tk.Tk):
         ttk.Scale(controls, from_=0.1, to=2.0, variable=self.speed, orient='horizontal').pack(side='left')
 
     def draw_step(self):
+        if not self.steps:
+            self.step_label.config(text="No mapping steps recorded")
+            return
         step = self.steps[self.index]
         node = step['node']
         children = step['children']
 
         G = nx.DiGraph()
-        n_name = node.output_signal if hasattr(node, 'output_signal') else str(node)
+        n_name = str(node)
         G.add_node(n_name)
 
         for c in children:
-            c_name = c.output_signal if hasattr(c, 'output_signal') else str(c)
+            c_name = str(c)
             G.add_node(c_name)
             G.add_edge(c_name, n_name)
 
@@ -149,69 +238,273 @@ class MappingAnimator(tk.Tk):
 
 # Wrapper to optionally launch GUI after mapping
 
-def tech_mapping_pass(db: TinyDB, lib: TinyLib, visualize=False):
+def output_clusters(db):
+    """
+    Partition the variables of db into clusters of output cones sharing nodes,
+    by union-find over the variables whose trees reach a common node
+
+    Returns:
+        list: (variable names, number of nodes) of each cluster, in the order of db.vars
+    """
+    parent = {}
+    owner = {}
+    size = {}
+
+    def find(var):
+        while parent[var] != var:
+            parent[var] = parent[parent[var]]
+            var = parent[var]
+        return var
+
+    for var, tree in db.vars.items():
+        if not isinstance(tree, Node):
+            continue
+        parent[var] = var
+        size[var] = 0
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            other = owner.get(id(node))
+            if other is not None:
+                # The rest of the cone is already owned as well
+                parent[find(other)] = find(var)
+                continue
+            owner[id(node)] = var
+            size[var] += 1
+            stack.extend(c for c in node.children if isinstance(c, Node))
+
+    clusters = {}
+    for var in parent:
+        names, n = clusters.get(find(var), ([], 0))
+        names.append(var)
+        clusters[find(var)] = (names, n + size[var])
+    return list(clusters.values())
+
+def flatten_trees(trees):
+    """
+    Encode trees as a list of (node class, output signal, children) with fanins first,
+    where a child is ("node", index in the list) or ("leaf", leaf). Unlike the trees
+    themselves the list pickles without recursion, however deep the logic.
+
+    Returns:
+        tuple: (list of nodes, index of the root of each tree)
+    """
+    index = {}
+    nodes = []
+    for tree in trees:
+        stack = [(tree, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if id(node) in index:
+                continue
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((c, False) for c in reversed(node.children) if isinstance(c, Node))
+                continue
+            index[id(node)] = len(nodes)
+            children = tuple(("node", index[id(c)]) if isinstance(c, Node) else ("leaf", c) for c in node.children)
+            nodes.append((type(node), node.output_signal, children))
+    return nodes, [index[id(tree)] for tree in trees]
+
+def _init_mapper(lib_file):
+    global _worker_lib, _worker_cache
+    set_verbose_level(WARN)
+    _worker_lib = TinyLib(lib_file)
+    _worker_cache = MappingCache()
+
+def _map_cluster(task):
+    """
+    Find the covers of the variables of a task in a worker
+
+    Returns:
+        tuple: (cache key of each variable, packed cache entries of all covered nodes)
+    """
+    names, nodes, roots, known = task
+    for key, entry in unpack_entries(known).items():
+        _worker_cache.put(key, entry)
+    built = []
+    for cls, out, children in nodes:
+        built.append(cls(*[built[c] if kind == "node" else c for kind, c in children], out=out))
+    hashes = {}
+    covers = {}
+    root_ids = {id(built[r]) for r in roots}
+    for node in built:
+        if id(node) not in root_ids:
+            find_cover(node, _worker_lib, _worker_cache, hashes, covers)
+    for r in roots:
+        find_cover(built[r], _worker_lib, _worker_cache, hashes, covers)
+    entries = {}
+    for node in built:
+        if covers[id(node)][0] is not None:
+            entries[(hashes[id(node)], _worker_lib.fingerprint)] = covers[id(node)]
+    return [(hashes[id(built[r])], _worker_lib.fingerprint) for r in roots], pack_entries(entries)
+
+def map_clusters(db, lib, cache, workers):
+    """
+    Find the covers of all variables of db on a process pool. Clusters of output cones
+    are packed into tasks, largest first into the lightest task, and every worker loads
+    the library once. A task only carries the cached covers of its own nodes.
+
+    Returns:
+        dict: (template, cost) of each variable, None if db has a single cluster
+    """
+    clusters = output_clusters(db)
+    if len(clusters) < 2:
+        return None
+    n_tasks = min(len(clusters), workers * TASKS_PER_WORKER)
+    bins = [[] for _ in range(n_tasks)]
+    loads = [0] * n_tasks
+    for names, size in sorted(clusters, key=lambda c: -c[1]):
+        lightest = loads.index(min(loads))
+        bins[lightest].extend(names)
+        loads[lightest] += size
+    tasks = []
+    hashes = {}
+    for names in bins:
+        trees = [db.vars[name] for name in names]
+        nodes, roots = flatten_trees(trees)
+        known = {}
+        for tree in trees:
+            structural_hash(tree, hashes)
+        for node in topological(trees):
+            key = (hashes[id(node)], lib.fingerprint)
+            if key in cache.entries:
+                known[key] = cache.entries[key]
+        tasks.append((names, nodes, roots, pack_entries(known)))
+    vprint(f"Mapping {len(clusters)} clusters in {n_tasks} tasks on {workers} workers", v=VERBOSE)
+
+    covers = {}
+    with ProcessPoolExecutor(workers, mp_context=pool_context(), initializer=_init_mapper,
+                             initargs=(lib.lib_file,)) as pool:
+        # Results come back in task order, so the merge does not depend on scheduling
+        for (names, *_), (keys, packed) in zip(tasks, pool.map(_map_cluster, tasks)):
+            entries = unpack_entries(packed)
+            for key, entry in entries.items():
+                cache.put(key, entry)
+            for name, key in zip(names, keys):
+                covers[name] = entries.get(key, (None, math.inf))
+    return covers
+
+def tech_mapping_pass(db: TinyDB, lib: TinyLib, visualize=False, cache=None, log=None, workers=1):
+    """
+    Technology mapping pass for the TinyDB
+
+    Args:
+        visualize (bool): Animate the recorded mapping steps once mapping is done
+        cache (MappingCache): Covers reused across runs, keyed by the structure of each subject
+                              tree and the library. The process wide in-memory cache if None,
+                              pass MappingCache(path=...) to keep covers on disk.
+        log (MappingLog): Records the mapping steps, off unless given or visualizing.
+                          Pass MappingLog(path=...) to stream them to a file that
+                          replay_mapping animates later. A recorded run ignores cache,
+                          so every cover it finds is recorded.
+        workers (int): Worker processes mapping clusters of output cones that share no logic,
+                       None uses every core. The result is the same as mapping serially.
+                       Recording steps maps serially.
+    """
     from utils.PrettyStream import vprint_title, vprint, vprint_pretty, INFO, VERBOSE
 
     vprint_title("Technology Mapping Pass", v=INFO)
     vprint(f"Mapping {db.name} to technology library {lib.libname}", v=INFO)
     original_db = db
     db = original_db.make_empty_copy()
+    cache = mapping_cache if cache is None else cache
+    hashes = {}
+    covers = None
+    if visualize and log is None:
+        log = MappingLog()
+    if log is not None:
+        # Covers found in the cache would never be recorded, so a recorded run starts from scratch
+        cache = MappingCache()
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and log is None:
+        covers = map_clusters(original_db, lib, cache, workers)
+    if covers is None:
+        # Cover bottom-up so find_cover never recurses
+        found = {}
+        roots = {id(node) for node in original_db.vars.values()}
+        for node in original_db.topological_order():
+            if id(node) not in roots:
+                find_cover(node, lib, cache, hashes, found, log)
+        covers = {}
+        for var, node in original_db.vars.items():
+            if isinstance(node, Node):
+                covers[var] = find_cover(node, lib, cache, hashes, found, log)
 
     for var, node in original_db.vars.items():
         if node is None:
             vprint(f"Skipping input {var}", v=VERBOSE)
             continue
+        if not isinstance(node, Node):
+            db.add_var(var, node)
+            continue
         vprint(f"Mapping {var}...", v=VERBOSE)
-        t, _ = tech_map(node, lib, out=var)
+        template, _ = covers[var]
+        if template is None:
+            raise ValueError(f"No pattern of {lib.libname} matches the logic of {var}")
+        t = build_cover(template, node, lib, out=var)
         t.state = Node.State.POST_SYNTH
         db.add_var(var, t)
-        
+
+    cache.save()
+    vprint(f"Mapping cache: {cache.hits} hits, {cache.misses} misses, {len(cache)} covers", v=VERBOSE)
+
     vprint("Mapped", db, v=INFO)
     vprint_pretty(db, v=VERBOSE)
 
+    if log is not None:
+        log.close()
     if visualize:
-        app = MappingAnimator(tech_map_steps)
+        app = MappingAnimator(log.replay())
         app.mainloop()
 
     return db
 
-def match_pattern(node, pattern, env={}):
-    #vprint(f"matching \n{node.pretty(PrettyStream())}\n with \n{form.pretty(PrettyStream())}Given:{env}")
-    # Check if current node matches the pattern
-    if node.cell_name != pattern.cell_name:
-        return None
-    if len(node.children) != len(pattern.children):
+def replay_mapping(path):
+    """
+    Animate the steps of a mapping log file
+    """
+    app = MappingAnimator(read_steps(path))
+    app.mainloop()
+
+def match_pattern(node, pattern, env=None):
+    """
+    Match a pattern against the tree rooted at node.
+    Children of symmetric cells are tried in both orders, other cells match in pin order.
+    Terminals bound more than once must bind the same signal.
+    Children are not put in structural hash order: a pattern terminal matches any subject
+    child, so hashes of terminals and subject children say nothing about how they pair,
+    and a single hash-ordered pairing misses matches.
+
+    Args:
+        env (dict): Bindings of pattern terminals the match has to agree with
+    Returns:
+        dict: env extended with the bindings of the pattern's terminals, or None if there is no match
+    """
+    env = {} if env is None else env
+    children = node.children
+    if node.cell_name != pattern.cell_name or len(children) != len(pattern.children):
         return None
-    # try all permutations to match against gate
-    for perm in permutations(node.children):
-        # Copy matching environment
-        top_env = env.copy() 
-        matching_children = 0
-        # Match individual Children
-        for i in range(len(perm)):
-            c = perm[i] # self's child
-            f = pattern.children[i] # the patterns's child
-            # If child is terminal
+    orders = (children,)
+    # Swapping identical children gives the same match, so only try one order
+    if len(children) > 1 and type(pattern).is_symmetric() and (len(children) > 2 or children[0] != children[1]):
+        orders = permutations(children)
+    for order in orders:
+        top_env = env.copy()
+        for c, f in zip(order, pattern.children):
             if isinstance(f, str):
-                # break if patterns's terminal is already matched to something else
                 if f in top_env and c != top_env[f]:
-                    matching_children = -1
                     break
-                # Match this terminal to patterns's terminal
                 top_env[f] = c
-                #vprint(f'Matched {f} with {c}',v=PASSED)
-                matching_children += 1   
-            # If child is node
-            elif isinstance(c, Node):
-                # try to match the node
-                child_env = match_pattern(c,f,top_env)
-                if child_env is None: # break if there is no match
-                    break 
-                else: # otherwise update the env
-                    top_env.update(child_env)
-                    matching_children += 1
-        # If all children matched, we found a match
-        if matching_children == len(perm):    
+            # A pattern gate only matches a subject gate of the same cell
+            elif isinstance(c, Node) and c.cell_name == f.cell_name:
+                child_env = match_pattern(c, f, top_env)
+                if child_env is None:
+                    break
+                top_env = child_env
+            else:
+                break
+        else:
             return top_env
-    #vprint("No Match", v=FAILED)
-    return None
\ No newline at end of file
+    return None
@@ -0,0 +1,172 @@
+"""
+Small random circuits with their truth tables computed by brute force, independently
+of the engines under test. Bit j of a truth table is the value of the output when
+input i, in sorted order, is set to bit i of j.
+"""
+import random
+from db.TinyDB import TinyDB
+from db.Patterns import exhaustive_word
+from db.LogicNodes import AND, NAND, OR, NOR, XOR, XNOR, INV
+
+GATES = {
+    AND: lambda a, b: a & b,
+    NAND: lambda a, b: 1 - (a & b),
+    OR: lambda a, b: a | b,
+    NOR: lambda a, b: 1 - (a | b),
+    XOR: lambda a, b: a ^ b,
+    XNOR: lambda a, b: 1 - (a ^ b),
+    INV: lambda a: 1 - a,
+}
+
+def random_circuit(seed, n_inputs=4, n_gates=12, n_outputs=4):
+    """
+    Build a random DAG of logic gates. Gates with more than one reader become variables,
+    gate children may be constants, and outputs may be assigned a plain signal or a constant.
+
+    Returns:
+        tuple: (TinyDB, dict mapping each output to its truth table)
+    """
+    rng = random.Random(seed)
+    inputs = [f"i{n}" for n in range(n_inputs)]
+    # Each signal is ("input", name), ("const", value) or (gate class, fanin signals)
+    signals = [("input", name) for name in inputs]
+    for _ in range(n_gates):
+        gate = rng.choice(list(GATES))
+        arity = 1 if gate is INV else 2
+        fanins = []
+        for _ in range(arity):
+            if not signals or rng.random() < 0.1:
+                signals.append(("const", rng.randint(0, 1)))
+            fanins.append(rng.randrange(len(signals)))
+        signals.append((gate, fanins))
+    gates = [s for s, (kind, _) in enumerate(signals) if kind not in ("input", "const")]
+
+    outputs = {}
+    for n in range(n_outputs):
+        kind = rng.random()
+        if kind < 0.15:
+            outputs[f"o{n}"] = ("const", rng.randint(0, 1))
+        elif kind < 0.3 and outputs:
+            outputs[f"o{n}"] = ("output", rng.choice(list(outputs)))
+        elif kind < 0.4 or not gates:
+            outputs[f"o{n}"] = ("signal", rng.randrange(len(signals)))
+        else:
+            outputs[f"o{n}"] = ("signal", rng.choice(gates[len(gates) // 2:]))
+
+    readers = [0] * len(signals)
+    for kind, fanins in signals:
+        if kind not in ("input", "const"):
+            for f in fanins:
+                readers[f] += 1
+    # The first output reading a gate holds its tree, like the outputs built by the parser
+    var_names = {}
+    for name, (kind, s) in outputs.items():
+        if kind == "signal":
+            readers[s] += 1
+            if signals[s][0] not in ("input", "const"):
+                var_names.setdefault(s, name)
+
+    db = TinyDB(f"random_{seed}")
+    for name in inputs:
+        db.add_input(name)
+    for name in outputs:
+        db.add_output(name)
+    trees = {}
+
+    def ref(s):
+        kind, value = signals[s]
+        if kind in ("input", "const"):
+            return value
+        return var_names[s] if s in var_names else trees[s]
+
+    for s, (kind, fanins) in enumerate(signals):
+        if kind in ("input", "const"):
+            continue
+        trees[s] = kind(*[ref(f) for f in fanins], out=var_names.get(s))
+        if readers[s] > 1:
+            var_names.setdefault(s, f"w{s}")
+        if s in var_names:
+            db.add_var(var_names[s], trees[s])
+    for name, (kind, value) in outputs.items():
+        if db.vars[name] is None:
+            # Outputs aliasing another output name it, as the parser does
+            db.add_var(name, ref(value) if kind == "signal" else value)
+
+    def evaluate(s, env):
+        kind, value = signals[s]
+        if kind == "input":
+            return env[value]
+        if kind == "const":
+            return value
+        return GATES[kind](*[evaluate(f, env) for f in value])
+
+    def output_value(name, env):
+        kind, value = outputs[name]
+        if kind == "const":
+            return value
+        if kind == "output":
+            return output_value(value, env)
+        return evaluate(value, env)
+
+    truth = {name: 0 for name in outputs}
+    for j in range(1 << n_inputs):
+        env = {name: (j >> i) & 1 for i, name in enumerate(inputs)}
+        for name in outputs:
+            truth[name] |= output_value(name, env) << j
+    return db, truth
+
+def exhaustive_words(db):
+    """
+    Packed words enumerating every pattern of the inputs of db, in the bit order of truth tables
+
+    Returns:
+        tuple: (words, width)
+    """
+    names = sorted(db.inputs)
+    width = 1 << len(names)
+    return {name: exhaustive_word(i, width) for i, name in enumerate(names)}, width
+
+def circuits(n=20, **sizes):
+    """
+    Random circuits over a range of sizes, including circuits without inputs
+    """
+    return [random_circuit(seed, n_inputs=seed % 6, **sizes) for seed in range(n)]
+
+def table_db(truth, n_inputs, name="table"):
+    """
+    Build a sum of minterms for each truth table, structurally unrelated to the random circuits
+    """
+    inputs = [f"i{n}" for n in range(n_inputs)]
+    db = TinyDB(name)
+    for i in inputs:
+        db.add_input(i)
+    for output, table in truth.items():
+        tree = 0
+        for j in range(1 << n_inputs):
+            if (table >> j) & 1:
+                term = 1
+                for i, leaf in enumerate(inputs):
+                    term = AND(term, leaf if (j >> i) & 1 else INV(leaf))
+                tree = OR(tree, term)
+        db.add_output(output, tree)
+    return db
+
+def pairs(n=20):
+    """
+    Random circuits paired with an equivalent sum of minterms, the sum of minterms of
+    a truth table differing in one pattern, and another random circuit over the same inputs
+
+    Returns:
+        list: (db, truth, other, other truth) tuples
+    """
+    cases = []
+    for seed, (db, truth) in enumerate(circuits(n)):
+        n_inputs = len(db.inputs)
+        flipped = dict(truth)
+        output = sorted(truth)[seed % len(truth)]
+        flipped[output] ^= 1 << (seed % (1 << n_inputs))
+        other, other_truth = random_circuit(seed + 1000, n_inputs=n_inputs)
+        cases.append((db, truth, table_db(truth, n_inputs), truth))
+        cases.append((db, truth, table_db(flipped, n_inputs, "flipped"), flipped))
+        cases.append((db, truth, other, other_truth))
+    return cases
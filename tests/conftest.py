@@ -0,0 +1,33 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.PrettyStream import set_verbose_level, QUIET
+from db.TinyLib import TinyLib
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    """
+    Run every test from the repository root, where the passes expect dbfiles/ to be
+    """
+    monkeypatch.chdir(ROOT)
+    set_verbose_level(QUIET)
+
+@pytest.fixture(scope="session")
+def lib():
+    set_verbose_level(QUIET)
+    return TinyLib(os.path.join(ROOT, "dbfiles", "stdcells.lib"))
+
+@pytest.fixture
+def write_sv(tmp_path):
+    """
+    Write a SystemVerilog module to a temporary file and return its path
+    """
+    def write(source, name="t.sv"):
+        path = tmp_path / name
+        path.write_text(source)
+        return str(path)
+    return write
@@ -0,0 +1,47 @@
+import sys
+import pytest
+from db.BDD import BDD, FALSE, dfs_order, find_bdd_mismatch
+from db.Simulator import Simulator
+from circuits import pairs
+
+PAIRS = pairs()
+
+def pattern(env, names):
+    return sum(env[name] << i for i, name in enumerate(names))
+
+@pytest.mark.parametrize("db, truth, other, other_truth", PAIRS)
+def test_equal_functions_share_an_edge(db, truth, other, other_truth):
+    sim = Simulator.from_db(db)
+    other_sim = Simulator.from_db(other)
+    bdd = BDD(dfs_order([sim, other_sim]))
+    mine = bdd.build(sim)
+    theirs = bdd.build(other_sim)
+    for output in truth:
+        assert (mine[output] == theirs[output]) == (truth[output] == other_truth[output])
+
+@pytest.mark.parametrize("db, truth, other, other_truth", PAIRS)
+def test_mismatch_is_a_counterexample(db, truth, other, other_truth):
+    outputs = sorted(truth)
+    mismatch = find_bdd_mismatch(Simulator.from_db(db), Simulator.from_db(other), [(o, o) for o in outputs])
+    differing = [o for o in outputs if truth[o] != other_truth[o]]
+    if not differing:
+        assert mismatch is None
+        return
+    (output, _), env = mismatch
+    assert output == differing[0]
+    j = pattern(env, sorted(db.inputs))
+    assert (truth[output] >> j) & 1 != (other_truth[output] >> j) & 1
+
+def test_ite_deeper_than_the_recursion_limit():
+    n = 3 * sys.getrecursionlimit()
+    bdd = BDD([f"x{i}" for i in range(n)])
+    parity, disjunction = FALSE, FALSE
+    # Adding variables from the bottom level up keeps each step constant time
+    for i in reversed(range(n)):
+        parity = bdd.XOR(bdd.variable(f"x{i}"), parity)
+        disjunction = bdd.OR(bdd.variable(f"x{i}"), disjunction)
+    # An odd number of ones implies one of them, and proving it descends through every level
+    assert bdd.AND(parity, disjunction) == parity
+    assert bdd.OR(parity, disjunction) == disjunction
+    env = bdd.satisfy(bdd.AND(parity ^ 1, disjunction))
+    assert sum(env.values()) % 2 == 0 and any(env.values())
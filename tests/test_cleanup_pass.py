@@ -0,0 +1,61 @@
+import pytest
+from db.TinyDB import TinyDB
+from db.LogicNodes import AND, OR, XOR, INV
+from db.Simulator import Simulator
+from passes.CleanupPass import cleanup_pass
+from circuits import circuits, exhaustive_words
+
+def tables(db, reference):
+    words, width = exhaustive_words(reference)
+    result = Simulator.from_db(db).run(words, width)
+    return {o: w & ((1 << width) - 1) for o, w in result.items()}
+
+def database(**outputs):
+    db = TinyDB("t")
+    for name in ("a", "b", "c"):
+        db.add_input(name)
+    for name, tree in outputs.items():
+        db.add_output(name, tree)
+    return db
+
+def cleaned(db):
+    clean = cleanup_pass(db)
+    assert clean.outputs == db.outputs
+    assert tables(clean, db) == tables(db, db)
+    return clean
+
+def cells(db):
+    return sorted(node.cell_name for node in db.topological_order())
+
+def test_constants_are_folded():
+    clean = cleaned(database(x=AND("a", 0), y=OR("b", 1), z=XOR(AND("c", 1), 0)))
+    # Outputs tied to a constant or an input are driven by two inverters
+    assert cells(clean) == ["INV"] * 6
+    assert [clean.vars[o].children[0].children[0] for o in "xyz"] == [0, 1, "c"]
+
+def test_double_inverters_cancel():
+    clean = cleaned(database(x=INV(INV(AND("a", INV(INV("b"))))), y=INV(INV(INV("c")))))
+    assert cells(clean) == ["AND", "INV"]
+    assert list(clean.vars["x"].children) == ["a", "b"]
+
+def test_identical_gates_merge_across_variables():
+    db = database(x=AND("a", "b"), y=OR(AND("b", "a"), "c"))
+    db.add_var("w", XOR(AND("a", "b"), "c"))
+    db.add_output("z", INV("w"))
+    clean = cleaned(db)
+    assert cells(clean).count("AND") == 1
+    assert clean.vars["y"].children[0] == "x"
+
+def test_dead_logic_is_dropped():
+    db = database(x=AND("a", "b"))
+    db.add_var("unused", XOR("a", "c"))
+    db.add_var("also_unused", OR("unused", "b"))
+    clean = cleaned(db)
+    assert set(clean.vars) == {"a", "b", "c", "x"}
+    assert cells(clean) == ["AND"]
+
+@pytest.mark.parametrize("db, truth", circuits())
+def test_cleanup_keeps_truth_tables(db, truth):
+    clean = cleanup_pass(db)
+    assert tables(clean, db) == truth
+    assert len(clean.topological_order()) <= len(db.topological_order()) + 2 * len(db.outputs)
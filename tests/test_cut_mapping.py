@@ -0,0 +1,69 @@
+import pytest
+from db.Simulator import Simulator
+from passes.ParserPass import parser_pass
+from passes.NandInvPass import nand_inv_pass
+from passes.CleanupPass import cleanup_pass
+from passes.CutMappingPass import cut_mapping_pass
+from circuits import circuits, exhaustive_words
+
+CONSTANT_CONE = """module t(
+    input logic a,
+    input logic b,
+    output logic y,
+    output logic z
+);
+    assign y = a & ~a;
+    assign z = a | b;
+endmodule
+"""
+
+ALIAS = """module t(
+    input logic a,
+    input logic b,
+    output logic y,
+    output logic z,
+    output logic w
+);
+    assign y = a ^ b;
+    assign z = y;
+    assign w = 1'b1;
+endmodule
+"""
+
+@pytest.mark.parametrize("prepare", [
+    lambda db: nand_inv_pass(db, False),
+    lambda db: nand_inv_pass(db, True),
+    lambda db: cleanup_pass(nand_inv_pass(db, False)),
+], ids=["dag", "dup", "clean"])
+def test_constant_cone_is_tied(write_sv, lib, prepare):
+    db = parser_pass(write_sv(CONSTANT_CONE))
+    mapped = cut_mapping_pass(prepare(db), lib)
+    inverter = lib.function_index.inverter[1]
+    tie = mapped.vars["y"]
+    assert tie.cell_name == inverter and list(tie.children) == [1]
+    assert mapped.logical_eq(db, method="sat")
+
+def test_leaf_outputs_are_driven_by_cells(write_sv, lib, tmp_path):
+    db = parser_pass(write_sv(ALIAS))
+    mapped = cut_mapping_pass(nand_inv_pass(db, True), lib)
+    inverter = lib.function_index.inverter[1]
+    buffer = mapped.vars["z"]
+    assert buffer.cell_name == inverter and buffer.children[0].cell_name == inverter
+    assert list(buffer.children[0].children) == ["y"]
+    tie = mapped.vars["w"]
+    assert tie.cell_name == inverter and list(tie.children) == [0]
+    # Every output is driven by a gate of the written netlist
+    driven = {conn[list(conn)[-1]] for _, conn, _ in mapped.get_netlist()}
+    assert db.outputs <= driven
+    assert mapped.logical_eq(db, method="sat")
+    assert mapped.logical_eq(db)
+
+@pytest.mark.parametrize("convert", [False, True], ids=["gates", "nand_inv"])
+@pytest.mark.parametrize("k", [None, 2])
+@pytest.mark.parametrize("db, truth", circuits())
+def test_mapping_matches_truth_tables(lib, db, truth, k, convert):
+    mapped = cut_mapping_pass(nand_inv_pass(db) if convert else db, lib, k=k)
+    assert all(node.cell_name in lib.cells for node in mapped.topological_order())
+    words, width = exhaustive_words(db)
+    result = Simulator.from_db(mapped).run(words, width)
+    assert {o: w & ((1 << width) - 1) for o, w in result.items()} == truth
@@ -0,0 +1,87 @@
+import json
+import pytest
+from db.TinyLib import TinyLib
+from db.Simulator import Simulator
+from db.MappingCache import MappingCache
+from passes.NandInvPass import nand_inv_pass
+from passes.TechMappingPass import tech_mapping_pass
+from circuits import random_circuit, exhaustive_words
+
+@pytest.fixture
+def subject():
+    db, truth = random_circuit(7, n_inputs=5, n_gates=40, n_outputs=6)
+    return nand_inv_pass(db), truth
+
+@pytest.fixture
+def costly_mux(tmp_path, lib):
+    """
+    The shipped library with a more expensive MUX2D1, same cells but another fingerprint
+    """
+    with open(lib.lib_file) as f:
+        data = json.load(f)
+    data["cells"]["MUX2D1"]["cost"] = 100
+    path = tmp_path / "costly.lib"
+    path.write_text(json.dumps(data))
+    return TinyLib(str(path))
+
+def check(mapped, db, truth):
+    words, width = exhaustive_words(db)
+    result = Simulator.from_db(mapped).run(words, width)
+    assert {o: w & ((1 << width) - 1) for o, w in result.items()} == truth
+    return mapped.gate_count()
+
+def test_warm_cache_hits_and_maps_the_same(subject, lib):
+    db, truth = subject
+    cache = MappingCache()
+    cold = check(tech_mapping_pass(db, lib, cache=cache), db, truth)
+    misses = cache.misses
+    assert misses and len(cache) > 0
+    warm = check(tech_mapping_pass(db, lib, cache=cache), db, truth)
+    assert warm == cold
+    assert cache.misses == misses and cache.hits > 0
+
+def test_other_library_misses(subject, lib, costly_mux):
+    db, truth = subject
+    assert costly_mux.fingerprint != lib.fingerprint
+    cache = MappingCache()
+    shipped = check(tech_mapping_pass(db, lib, cache=cache), db, truth)
+    misses = cache.misses
+    costly = check(tech_mapping_pass(db, costly_mux, cache=cache), db, truth)
+    # Every cover is looked up again under the new fingerprint and none is found
+    assert cache.misses == 2 * misses
+    assert costly == check(tech_mapping_pass(db, costly_mux, cache=MappingCache()), db, truth)
+    assert costly != shipped
+
+def test_least_recently_used_covers_are_evicted():
+    cache = MappingCache(capacity=2)
+    cache.put("a", (None, 1))
+    cache.put("b", (None, 2))
+    assert cache.get("a") == (None, 1)
+    cache.put("c", (None, 3))
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == (None, 1) and cache.get("c") == (None, 3)
+
+def test_mapping_stays_within_capacity(subject, lib):
+    db, truth = subject
+    cache = MappingCache(capacity=8)
+    unbounded = check(tech_mapping_pass(db, lib, cache=MappingCache()), db, truth)
+    assert check(tech_mapping_pass(db, lib, cache=cache), db, truth) == unbounded
+    assert len(cache) == 8
+
+def test_cache_persists_to_disk(subject, lib, tmp_path):
+    db, truth = subject
+    path = str(tmp_path / "covers.pkl")
+    cache = MappingCache(path=path)
+    cold = check(tech_mapping_pass(db, lib, cache=cache), db, truth)
+    assert not cache.dirty
+
+    loaded = MappingCache(path=path)
+    assert list(loaded.entries) == list(cache.entries)
+    assert check(tech_mapping_pass(db, lib, cache=loaded), db, truth) == cold
+    assert loaded.misses == 0 and loaded.hits > 0
+
+def test_unreadable_cache_file_is_ignored(tmp_path):
+    path = tmp_path / "covers.pkl"
+    path.write_bytes(b"not a pickle")
+    assert len(MappingCache(path=str(path))) == 0
@@ -0,0 +1,45 @@
+import json
+import pytest
+from db.MappingLog import MappingLog, read_steps
+from passes.NandInvPass import nand_inv_pass
+from passes.TechMappingPass import tech_mapping_pass
+from circuits import random_circuit
+
+@pytest.fixture
+def subject():
+    db, _ = random_circuit(3, n_inputs=5, n_gates=40, n_outputs=6)
+    return nand_inv_pass(db)
+
+def full_log(db, lib):
+    log = MappingLog()
+    tech_mapping_pass(db, lib, log=log)
+    assert len(log.replay()) == len(log)
+    return log.replay()
+
+def test_nothing_is_recorded_by_default(subject, lib, monkeypatch):
+    def record(self, *args, **kwargs):
+        raise AssertionError("mapping recorded a step without a log")
+    monkeypatch.setattr(MappingLog, "record", record)
+    tech_mapping_pass(subject, lib)
+    tech_mapping_pass(subject, lib, workers=2)
+
+def test_memory_log_keeps_the_latest_steps(subject, lib):
+    steps = full_log(subject, lib)
+    assert len(steps) > 16
+    log = MappingLog(capacity=16)
+    tech_mapping_pass(subject, lib, log=log)
+    assert len(log) == len(steps)
+    assert log.replay() == steps[-16:]
+
+def test_file_log_replays(subject, lib, tmp_path):
+    steps = full_log(subject, lib)
+    path = str(tmp_path / "steps.jsonl")
+    log = MappingLog(capacity=16, path=path)
+    mapped = tech_mapping_pass(subject, lib, log=log)
+    # Steps stream to the file, so the capacity does not bound it
+    assert log.file is None and not log.steps
+    # Tuples of the steps come back from JSON as lists
+    assert read_steps(path) == log.replay() == json.loads(json.dumps(steps))
+    matched = [step for step in steps if step["matched"]]
+    assert all("tree" in step and "cost" in step for step in matched)
+    assert set(mapped.gate_count()) <= {step["cell"] for step in matched}
@@ -0,0 +1,28 @@
+import pytest
+from db.NandGraph import NandGraph
+from db.Simulator import Simulator
+from circuits import circuits, exhaustive_words
+
+CIRCUITS = circuits()
+
+def tables(result, width):
+    return {o: w & ((1 << width) - 1) for o, w in result.items()}
+
+@pytest.mark.parametrize("db, truth", CIRCUITS)
+def test_graph_matches_truth_tables(db, truth):
+    words, width = exhaustive_words(db)
+    assert tables(NandGraph.from_db(db).simulate(words, width), width) == truth
+
+@pytest.mark.parametrize("db, truth", CIRCUITS)
+def test_round_trip_matches_truth_tables(db, truth):
+    converted = NandGraph.from_db(db).to_db()
+    assert converted.outputs == db.outputs
+    words, width = exhaustive_words(db)
+    assert tables(Simulator.from_db(converted).run(words, width), width) == truth
+
+@pytest.mark.parametrize("db, truth", CIRCUITS)
+def test_identical_logic_is_hashed_once(db, truth):
+    graph = NandGraph.from_db(db)
+    gates = graph.gate_count()
+    assert graph.add_db(db) == graph.outputs
+    assert graph.gate_count() == gates
@@ -0,0 +1,32 @@
+import pytest
+from db.TinyDB import TinyDB
+from db.LogicNodes import NAND, INV, XOR
+from db.Simulator import Simulator
+from passes.NandInvPass import nand_inv_pass
+from circuits import circuits, exhaustive_words
+
+CIRCUITS = circuits()
+
+@pytest.mark.parametrize("duplicate", [False, True])
+@pytest.mark.parametrize("db, truth", CIRCUITS)
+def test_conversion_matches_truth_tables(db, truth, duplicate):
+    converted = nand_inv_pass(db, duplicate)
+    assert all(isinstance(node, (NAND, INV)) for node in converted.topological_order())
+    words, width = exhaustive_words(db)
+    result = Simulator.from_db(converted).run(words, width)
+    assert {o: w & ((1 << width) - 1) for o, w in result.items()} == truth
+
+def parity(n):
+    db = TinyDB(f"parity_{n}")
+    for i in range(n):
+        db.add_input(f"i{i}")
+    tree = "i0"
+    for i in range(1, n):
+        tree = XOR(tree, f"i{i}")
+    db.add_output("y", tree)
+    return db
+
+def test_nested_xors_stay_linear():
+    small = sum(nand_inv_pass(parity(8)).gate_count().values())
+    large = sum(nand_inv_pass(parity(16)).gate_count().values())
+    assert large <= 2 * small + 8
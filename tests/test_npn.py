@@ -0,0 +1,54 @@
+from itertools import permutations
+
+def bit(table, index):
+    return (table >> index) & 1
+
+def orbit(table, arity):
+    """
+    Every function obtained from table by permuting, negating inputs and negating the output
+
+    Returns:
+        dict: Mapping from each function to the fewest inverters needed to get it
+    """
+    tables = {}
+    for order in permutations(range(arity)):
+        for negated in range(1 << arity):
+            for inverted in (0, 1):
+                result = 0
+                for j in range(1 << arity):
+                    index = sum((bit(j, order[p]) ^ bit(negated, p)) << p for p in range(arity))
+                    result |= (bit(table, index) ^ inverted) << j
+                inverters = bin(negated).count("1") + inverted
+                tables[result] = min(inverters, tables.get(result, inverters))
+    return tables
+
+def arities(lib):
+    return sorted({len(cell.input_pins) for cell in lib.cells.values()})
+
+def test_matches_compute_their_table(lib):
+    index = lib.function_index
+    for arity in arities(lib):
+        for table in range(1 << (1 << arity)):
+            match = index.lookup(arity, table)
+            if match is None:
+                continue
+            cost, cell_name, pins, negated, inverted = match
+            cell = lib.cells[cell_name]
+            assert sorted(pins) == list(range(arity))
+            for j in range(1 << arity):
+                pin_values = [bit(j, pins[p]) ^ bit(negated, p) for p in range(arity)]
+                index_bits = sum(v << p for p, v in enumerate(pin_values))
+                assert bit(cell.truth_table(), index_bits) ^ inverted == bit(table, j)
+
+def test_lookup_finds_the_cheapest_cell_of_every_npn_orbit(lib):
+    index = lib.function_index
+    inverter = index.inverter[0]
+    for arity in arities(lib):
+        cheapest = {}
+        for cell_name, cell in lib.cells.items():
+            if len(cell.input_pins) == arity:
+                for table, inverters in orbit(cell.truth_table(), arity).items():
+                    cost = lib.cell_costs[cell_name] + inverters * inverter
+                    cheapest[table] = min(cost, cheapest.get(table, cost))
+        found = {t: index.lookup(arity, t)[0] for t in range(1 << (1 << arity)) if index.lookup(arity, t) is not None}
+        assert found == cheapest
@@ -0,0 +1,151 @@
+import os
+import time
+import random
+import itertools
+import pytest
+from db.LogicNodes import Node, AND, XOR, XNOR, NAND
+from db.Simulator import Simulator
+from passes.ParserPass import parser_pass, parse_many, rename_wires, scan_netlist, _MODULE_LINE, _WIRE_NAME
+from circuits import exhaustive_words
+
+WRAPPED_HEADER = """module top(in_signal_alpha, in_signal_beta_gamma,
+    out_signal);
+  input in_signal_alpha;
+  input in_signal_beta_gamma;
+  output out_signal;
+  assign out_signal = in_signal_alpha & in_signal_beta_gamma;
+endmodule
+"""
+
+def test_wrapped_header_falls_back_to_the_full_parser(write_sv):
+    path = write_sv(WRAPPED_HEADER, "top.v")
+    start = time.perf_counter()
+    assert scan_netlist(path) is None
+    db = parser_pass(path)
+    assert time.perf_counter() - start < 10
+    assert db.name == "top"
+    assert db.inputs == {"in_signal_alpha", "in_signal_beta_gamma"}
+    assert db.outputs == {"out_signal"}
+    assert db.eval(in_signal_alpha=1, in_signal_beta_gamma=1) == {"out_signal": True}
+
+def test_failing_header_does_not_backtrack():
+    start = time.perf_counter()
+    assert _MODULE_LINE.fullmatch("module t(" + "a" * 4096) is None
+    assert _MODULE_LINE.fullmatch("module t(" + "a, " * 4096) is None
+    assert time.perf_counter() - start < 1
+
+def test_single_line_header_takes_the_fast_path(write_sv):
+    path = write_sv(WRAPPED_HEADER.replace(",\n    out_signal", ", out_signal"), "top.v")
+    db = scan_netlist(path)
+    assert db is not None and db.name == "top" and db.outputs == {"out_signal"}
+
+def parse_expr(write_sv, expr, inputs="abcd"):
+    ports = "".join(f"input logic {i}, " for i in inputs)
+    return parser_pass(write_sv(f"module t({ports}output logic y); assign y = {expr}; endmodule"))
+
+def depth(node):
+    if not isinstance(node, Node):
+        return 0
+    return 1 + max(depth(child) for child in node.children)
+
+# Python gives & ^ | the same relative precedence as Verilog
+@pytest.mark.parametrize("expr, model", [
+    ("a | b & c", lambda a, b, c, d: a | (b & c)),
+    ("a & b | c", lambda a, b, c, d: (a & b) | c),
+    ("a ^ b & c", lambda a, b, c, d: a ^ (b & c)),
+    ("a | b ^ c", lambda a, b, c, d: a | (b ^ c)),
+    ("~a | b", lambda a, b, c, d: (1 - a) | b),
+    ("~a & ~b ^ c | d", lambda a, b, c, d: (((1 - a) & (1 - b)) ^ c) | d),
+    ("a ~& b | c ~^ d", lambda a, b, c, d: (1 - (a & b)) | (1 - (c ^ d))),
+    ("a & b & c & d", lambda a, b, c, d: a & b & c & d),
+    ("a ^ b ^ c ^ d", lambda a, b, c, d: a ^ b ^ c ^ d),
+    ("a ~& b ~& c", lambda a, b, c, d: 1 - ((1 - (a & b)) & c)),
+    ("a ~| b | c", lambda a, b, c, d: (1 - (a | b)) | c),
+    ("a & b ~& c & d", lambda a, b, c, d: (1 - ((a & b) & c)) & d),
+    ("a ^~ b", lambda a, b, c, d: 1 - (a ^ b)),
+    ("a ~^ b ^~ c", lambda a, b, c, d: a ^ b ^ c),
+])
+def test_operator_precedence_and_chains(write_sv, expr, model):
+    db = parse_expr(write_sv, expr)
+    for values in itertools.product((0, 1), repeat=4):
+        env = dict(zip("abcd", values))
+        assert db.eval(**env) == {"y": bool(model(*values))}, env
+
+@pytest.mark.parametrize("op, cls", [("&", AND), ("^", XOR), ("~^", XNOR), ("^~", XNOR)])
+def test_associative_chains_are_balanced(write_sv, op, cls):
+    inputs = [f"a{i}" for i in range(16)]
+    db = parse_expr(write_sv, f" {op} ".join(inputs), inputs)
+    assert depth(db.vars["y"]) == 4
+    assert {type(node) for node in db.topological_order()} == {cls}
+
+def test_non_associative_chains_nest_to_the_left(write_sv):
+    y = parse_expr(write_sv, "a ~& b ~& c ~& d").vars["y"]
+    assert depth(y) == 3
+    assert isinstance(y, NAND) and y.children[1] == "d"
+
+def test_netlist_fallback_shares_the_precedence(write_sv):
+    source = WRAPPED_HEADER.replace("in_signal_alpha & in_signal_beta_gamma",
+                                    "in_signal_alpha | ~in_signal_alpha ^ in_signal_beta_gamma")
+    db = parser_pass(write_sv(source, "top.v"))
+    for alpha, beta in itertools.product((0, 1), repeat=2):
+        expected = alpha | ((1 - alpha) ^ beta)
+        assert db.eval(in_signal_alpha=alpha, in_signal_beta_gamma=beta) == {"out_signal": bool(expected)}
+
+def random_module(seed):
+    """
+    A module with nested expressions, so the parser names intermediate wires
+    """
+    rng = random.Random(seed)
+    inputs = [f"i{n}" for n in range(1 + seed % 5)]
+
+    def expr(level):
+        if level == 0 or rng.random() < 0.2:
+            return rng.choice(inputs + ["1'b0", "1"])
+        if rng.random() < 0.2:
+            return f"~{expr(level - 1)}"
+        op = rng.choice(["&", "~&", "|", "~|", "^", "~^", "^~"])
+        return f"({' {} '.format(op).join(expr(level - 1) for _ in range(rng.randint(2, 4)))})"
+
+    ports = "".join(f"input logic {i}, " for i in inputs)
+    body = f"logic w; assign w = {expr(3)}; "
+    body += "".join(f"assign y{n} = {expr(3)} ^ w; " for n in range(3))
+    return f"module m{seed}({ports}output logic y0, output logic y1, output logic y2); {body}endmodule"
+
+def tables(db):
+    words, width = exhaustive_words(db)
+    return {o: w & ((1 << width) - 1) for o, w in Simulator.from_db(db).run(words, width).items()}
+
+def wire_names(db):
+    """
+    Names the parser made up for intermediate wires
+    """
+    return {node.output_signal for node in db.topological_order() if _WIRE_NAME.fullmatch(node.output_signal)}
+
+@pytest.fixture
+def sources(write_sv):
+    files = [write_sv(random_module(seed), f"m{seed}.sv") for seed in range(8)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return files + [os.path.join(root, "verilog", "FullAdder.sv"), os.path.join(root, "verilog", "iscas85", "c17.v")]
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_parse_many_matches_serial_parses(sources, processes):
+    serial = [parser_pass(file) for file in sources]
+    parsed = parse_many(sources, workers=3, processes=processes)
+    assert [db.name for db in parsed] == [db.name for db in serial]
+    for db, reference in zip(parsed, serial):
+        assert db.inputs == reference.inputs and db.outputs == reference.outputs
+        assert db.gate_count() == reference.gate_count()
+        assert tables(db) == tables(reference)
+    # Wires parsed in other processes are renamed, so they never clash with ours or each other
+    names = [name for db in serial + parsed for name in wire_names(db)]
+    assert len(names) == len(set(names))
+
+def test_rename_wires_keeps_signal_names(write_sv):
+    db = parser_pass(write_sv(random_module(3)))
+    before, wires = tables(db), wire_names(db)
+    assert wires
+    rename_wires(db)
+    assert wire_names(db).isdisjoint(wires)
+    assert len(wire_names(db)) == len(wires)
+    assert {"y0", "y1", "y2", "w"} <= {node.output_signal for node in db.topological_order()}
+    assert tables(db) == before
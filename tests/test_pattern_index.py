@@ -0,0 +1,32 @@
+from db.LogicNodes import Node
+from passes.NandInvPass import nand_inv_pass
+from passes.TechMappingPass import match_pattern
+from circuits import circuits
+
+def library_patterns(lib):
+    return [(name, p) for name, cell in lib.cells.items() for p in cell.patterns if isinstance(p, Node)]
+
+def subjects(lib):
+    """
+    Every node of the NAND/INV graphs of random circuits, and the patterns of the library
+    """
+    for db, _ in circuits():
+        for duplicate in (False, True):
+            yield from nand_inv_pass(db, duplicate).topological_order()
+    for _, pattern in library_patterns(lib):
+        yield pattern
+
+def test_candidates_include_every_match(lib):
+    patterns = library_patterns(lib)
+    checked = scanned = matched = 0
+    for node in subjects(lib):
+        candidates = lib.pattern_index.candidates(node)
+        # Brute force: try every pattern of every cell
+        matches = [(name, p) for name, p in patterns if match_pattern(node, p) is not None]
+        assert all(any(p is q for _, q in candidates) for _, p in matches), node
+        # Candidates come in library order
+        assert candidates == [(name, p) for name, p in patterns if any(p is q for _, q in candidates)]
+        checked += len(candidates)
+        scanned += len(patterns)
+        matched += len(matches)
+    assert matched and checked < scanned
@@ -0,0 +1,46 @@
+import json
+import pickle
+import subprocess
+import sys
+from db.Simulator import Simulator
+from passes.NandInvPass import nand_inv_pass
+from passes.TechMappingPass import tech_mapping_pass
+from circuits import random_circuit, exhaustive_words
+from conftest import ROOT
+
+# Runs in a fresh interpreter that never loads a library: the cells of the mapped
+# database and of the library are rebuilt from their pickles alone
+FRESH = """
+import json, pickle, sys
+sys.path[:0] = [sys.argv[1], sys.argv[1] + "/tests"]
+from utils.PrettyStream import set_verbose_level, QUIET
+set_verbose_level(QUIET)
+from db.TinyLib import cell_table
+from db.Simulator import Simulator
+from passes.TechMappingPass import tech_mapping_pass
+from circuits import exhaustive_words
+assert not cell_table
+with open(sys.argv[2], "rb") as f:
+    mapped, lib, subject = pickle.load(f)
+words, width = exhaustive_words(subject)
+remapped = tech_mapping_pass(subject, lib)
+tables = [{o: w & ((1 << width) - 1) for o, w in Simulator.from_db(db).run(words, width).items()}
+          for db in (mapped, remapped)]
+print(json.dumps({"tables": tables, "gates": [mapped.gate_count(), remapped.gate_count()],
+                  "netlist": [c for c, _, _ in mapped.get_netlist()], "fingerprint": lib.fingerprint}))
+"""
+
+def test_mapped_database_and_library_unpickle_in_a_fresh_process(lib, tmp_path):
+    db, truth = random_circuit(5, n_inputs=5, n_gates=40, n_outputs=6)
+    subject = nand_inv_pass(db)
+    mapped = tech_mapping_pass(subject, lib)
+    path = tmp_path / "mapped.pkl"
+    path.write_bytes(pickle.dumps((mapped, lib, subject)))
+    run = subprocess.run([sys.executable, "-c", FRESH, ROOT, str(path)],
+                         capture_output=True, text=True, cwd=tmp_path)
+    assert run.returncode == 0, run.stderr
+    result = json.loads(run.stdout.splitlines()[-1])
+    assert result["tables"] == [truth, truth]
+    assert result["gates"] == [mapped.gate_count()] * 2
+    assert result["netlist"] == [c for c, _, _ in mapped.get_netlist()]
+    assert result["fingerprint"] == lib.fingerprint
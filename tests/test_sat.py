@@ -0,0 +1,21 @@
+import pytest
+from db.Equivalence import sat_counterexample
+from circuits import pairs
+
+PAIRS = pairs()
+
+@pytest.mark.parametrize("db, truth, other, other_truth", PAIRS)
+def test_sat_counterexample(db, truth, other, other_truth):
+    result = sat_counterexample(db, other)
+    if truth == other_truth:
+        assert result is None
+        return
+    output, env = result
+    mine = db.eval(env)
+    theirs = other.eval(env)
+    assert int(mine[output]) != int(theirs[output])
+
+@pytest.mark.parametrize("db, truth, other, other_truth", PAIRS)
+@pytest.mark.parametrize("method", ["sat", "auto"])
+def test_logical_eq(db, truth, other, other_truth, method):
+    assert db.logical_eq(other, method=method) == (truth == other_truth)
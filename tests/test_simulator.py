@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from db.Simulator import Simulator
+from circuits import circuits, exhaustive_words
+
+CIRCUITS = circuits()
+
+def table(words, output, width):
+    return int(words[output]) & ((1 << width) - 1)
+
+@pytest.mark.parametrize("db, truth", CIRCUITS)
+def test_simulator_matches_truth_tables(db, truth):
+    words, width = exhaustive_words(db)
+    result = Simulator.from_db(db).run(words, width)
+    assert {o: table(result, o, width) for o in truth} == truth
+
+@pytest.mark.parametrize("db, truth", CIRCUITS)
+def test_eval_matches_truth_tables(db, truth):
+    names = sorted(db.inputs)
+    for j in range(1 << len(names)):
+        result = db.eval({name: (j >> i) & 1 for i, name in enumerate(names)})
+        assert {o: int(result[o]) for o in truth} == {o: (t >> j) & 1 for o, t in truth.items()}
+
+@pytest.mark.parametrize("db, truth", CIRCUITS)
+def test_compiled_db_matches_truth_tables(db, truth):
+    words, width = exhaustive_words(db)
+    result = db.compile()(words, width)
+    assert {o: table(result, o, width) for o in truth} == truth
+
+@pytest.mark.parametrize("db, truth", CIRCUITS)
+def test_eval_batch_matches_truth_tables(db, truth):
+    func = db.compile()
+    n = 1 << len(func.inputs)
+    names = sorted(db.inputs)
+    rows = np.array([[(j >> names.index(name)) & 1 for name in func.inputs] for j in range(n)], dtype=bool)
+    result = db.eval_batch(rows.reshape(n, len(func.inputs)))
+    for column, output in enumerate(func.outputs):
+        expected = [(truth[output] >> j) & 1 for j in range(n)]
+        assert result[:, column].tolist() == [bool(e) for e in expected]
+
+def test_circuits_cover_leaf_outputs():
+    trees = [tree for db, _ in CIRCUITS for tree in (db.vars[o] for o in db.outputs)]
+    assert any(isinstance(tree, str) and tree.startswith("o") for tree in trees)
+    assert any(isinstance(tree, str) and tree.startswith("i") for tree in trees)
+    assert any(isinstance(tree, int) for tree in trees)
+    assert any(not db.inputs for db, _ in CIRCUITS)
@@ -0,0 +1,50 @@
+import pytest
+from db.TinyDB import TinyDB
+from db.Node import Node
+from db.LogicNodes import NAND
+from db.Simulator import Simulator
+from db.MappingCache import MappingCache
+from passes.NandInvPass import nand_inv_pass
+from passes.TechMappingPass import tech_mapping_pass, output_clusters
+from circuits import circuits, exhaustive_words
+
+def chain(prefix, n):
+    tree = f"{prefix}0"
+    for i in range(1, n):
+        tree = NAND(tree, f"{prefix}{i}")
+    return tree
+
+def test_deep_logic_maps_after_cache_evictions(lib):
+    db = TinyDB("chains")
+    for prefix in "xy":
+        for i in range(3000):
+            db.add_input(f"{prefix}{i}")
+    db.add_output("out", NAND(chain("x", 3000), chain("y", 3000)))
+    mapped = tech_mapping_pass(db, lib, cache=MappingCache(capacity=64))
+    env = {name: 1 for name in db.inputs}
+    assert mapped.eval(env) == db.eval(env)
+
+def shape(leaf):
+    """
+    The cells and leaves of a mapped tree, without the names of intermediate wires
+    """
+    if isinstance(leaf, Node):
+        return (leaf.cell_name, tuple(shape(c) for c in leaf.children))
+    return leaf
+
+SUBJECTS = [(nand_inv_pass(db), truth) for db, truth in circuits(24, n_gates=30, n_outputs=6)]
+
+def test_subjects_have_several_clusters():
+    assert sum(len(output_clusters(db)) > 1 for db, _ in SUBJECTS) > len(SUBJECTS) // 2
+
+@pytest.mark.parametrize("db, truth", SUBJECTS)
+def test_parallel_mapping_matches_serial(db, truth, lib):
+    serial = tech_mapping_pass(db, lib, cache=MappingCache())
+    cache = MappingCache()
+    for _ in range(2):
+        # The second run starts from the covers of the first one
+        parallel = tech_mapping_pass(db, lib, cache=cache, workers=2)
+        assert {v: shape(t) for v, t in parallel.vars.items()} == {v: shape(t) for v, t in serial.vars.items()}
+    words, width = exhaustive_words(db)
+    result = Simulator.from_db(parallel).run(words, width)
+    assert {o: w & ((1 << width) - 1) for o, w in result.items()} == truth
@@ -0,0 +1,56 @@
+import pytest
+from db.TinyDB import TinyDB
+from db.LogicNodes import AND, OR, INV
+from circuits import circuits
+
+def aliases():
+    db = TinyDB("aliases")
+    for name in ("a", "b", "c"):
+        db.add_input(name)
+    db.add_output("y", AND("a", "b"))
+    db.add_output("z", "y")
+    db.add_var("one", 1)
+    db.add_var("tied", "one")
+    db.add_var("c_alias", "c")
+    # Variables assigned to each other in a cycle drive nothing, resolve stops at q
+    db.add_var("p", "q")
+    db.add_var("q", "p")
+    return db
+
+@pytest.mark.parametrize("name, support", [
+    ("z", {"a", "b"}),
+    ("tied", set()),
+    ("c_alias", {"c"}),
+    ("p", {"q"}),
+])
+def test_support_follows_aliases(name, support):
+    assert aliases().support(name) == support
+
+def test_leaves_follow_aliases():
+    db = aliases()
+    tree = OR(INV("z"), AND("tied", "c_alias"))
+    db.add_output("w", tree)
+    assert tree.get_all_leaf(db) == {"a", "b", "c"}
+    assert db.support("w") == {"a", "b", "c"}
+
+def test_alias_support_follows_later_definitions():
+    db = TinyDB("late")
+    db.add_input("a")
+    db.add_output("y")
+    db.add_output("z", "y")
+    db.add_output("w", INV("z"))
+    assert db.support("w") == {"y"}
+    db.add_var("y", INV("a"))
+    assert db.support("w") == {"a"}
+
+@pytest.mark.parametrize("db, truth", circuits())
+def test_support_holds_the_inputs_outputs_depend_on(db, truth):
+    names = sorted(db.inputs)
+    for output, table in truth.items():
+        support = db.support(output)
+        assert support <= db.inputs
+        for i, name in enumerate(names):
+            # Flipping an input outside the support never changes the output
+            flipped = [(table >> (j ^ (1 << i))) & 1 for j in range(1 << len(names))]
+            if name not in support:
+                assert flipped == [(table >> j) & 1 for j in range(1 << len(names))]
@@ -87,13 +87,20 @@ class PrettyStream():
     def __init__(self, sep='  ', trail_sep='- '):
         self.depth = 0
         self.sep = sep
-        self.cache = ""
+        self.parts = []
         self.prefix = ""
         self.empty_line = True
         self.trail_sep = trail_sep
 
+    @property
+    def cache(self):
+        # Text is collected in parts and joined on demand, appending to one string is quadratic
+        if len(self.parts) > 1:
+            self.parts = ["".join(self.parts)]
+        return self.parts[0] if self.parts else ""
+
     def clear(self):
-        self.cache = ""
+        self.parts = []
 
     def make_indent(self):
         if self.trail_sep is not None and self.depth > 0:
@@ -103,7 +110,7 @@ class PrettyStream():
     def put_line(self, *others):
         if(len(others) == 0 or others == ""):
             return self
-        self.cache += self.make_indent() + self.prefix 
+        self.parts.append(self.make_indent() + self.prefix)
         if(self.prefix != ""):
             self.empty_line = False
         else:
@@ -115,7 +122,7 @@ class PrettyStream():
             else:
                 self.append_token(other)
         self.prefix = ""
-        self.cache += '\n'
+        self.parts.append('\n')
         self.empty_line = True
         return self
     
@@ -123,7 +130,7 @@ class PrettyStream():
         return self.put_line(*other)
     
     def __or__(self, other):
-        self.cache += self.get_sep() + str(other)
+        self.parts.append(self.get_sep() + str(other))
         return self
     
     def get_sep(self):
@@ -143,12 +150,12 @@ class PrettyStream():
     def append_token(self, token):
         s = str(token)
         if (s != ''):
-            self.cache += self.get_sep() + s
+            self.parts.append(self.get_sep() + s)
             self.empty_line = False
         return self
 
     def put(self, other):
-        self.cache += str(other)
+        self.parts.append(str(other))
         return self
 
     def __rshift__(self, other):